@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import os, json, time, random, argparse
+
+# Synthetic PBS data in the formats gen_data requests from qstat:
+#
+#   active.dsv      qstat -t -f -Fdsv -D"|-"
+#   history.dsv     qstat -x -t -f -Fdsv -D"|-"
+#   age.json        qstat 1 -f -Fjson (timestamp is filled in by the stub)
+
+STATES = "RRRQQHE"
+QUEUES = ["main", "develop", "preempt", "casper"]
+
+def pbs_time(epoch):
+    return time.strftime("%c", time.localtime(epoch))
+
+def make_job(job_num, pbs_server, rng, settings, now, state = None):
+    user = "user{:03d}".format(rng.randrange(settings.users))
+    state = state or rng.choice(STATES)
+    nodes = 1 + rng.randrange(4)
+    env = ["VAR{}=value_{}".format(n, rng.randrange(1 << 20)) for n in range(settings.env_vars)]
+    env += [r"PBS_O_WORKDIR=/glade/work/{}/runs\,case{}".format(user, job_num), f"PBS_O_HOME=/home/{user}"]
+
+    fields = [f"Job Id: {job_num}.{pbs_server}",
+              f"Job_Name=bench_job_{job_num}",
+              f"Job_Owner={user}@login{rng.randrange(8)}.hpc",
+              "resources_used.cpupercent={}".format(rng.randrange(12800)),
+              "resources_used.cput={:02d}:{:02d}:00".format(rng.randrange(100), rng.randrange(60)),
+              "resources_used.mem={}kb".format(rng.randrange(1 << 28)),
+              "resources_used.walltime={:02d}:{:02d}:00".format(rng.randrange(12), rng.randrange(60)),
+              f"job_state={state}",
+              "queue={}".format(rng.choice(QUEUES)),
+              f"server={pbs_server}",
+              "ctime={}".format(pbs_time(now - rng.randrange(86400))),
+              "Resource_List.ncpus={}".format(128 * nodes),
+              "Resource_List.mem={}gb".format(235 * nodes),
+              f"Resource_List.nodect={nodes}",
+              "Resource_List.walltime={:02d}:00:00".format(1 + rng.randrange(12)),
+              "qtime={}".format(pbs_time(now - rng.randrange(86400)))]
+
+    if state in "RE":
+        fields += ["exec_host=" + "+".join("dec{:04d}/0*128".format(rng.randrange(2500)) for _ in range(nodes)),
+                   "session_id={}".format(rng.randrange(1 << 20)),
+                   "stime={}".format(pbs_time(now - rng.randrange(43200)))]
+    elif state in "QH":
+        fields += ["estimated.start_time={}".format(pbs_time(now + rng.randrange(7 * 86400))),
+                   "comment=Not Running: Insufficient amount of resource: ncpus (R: {} A: 0 T: 320000)".format(128 * nodes)]
+    else:
+        fields += ["Exit_status={}".format(rng.choice([0, 0, 0, 1, 271])),
+                   "comment=Job run at {} on (dec0001:ncpus=128) and finished".format(pbs_time(now - 3600))]
+
+    fields += ["Variable_List=" + ",".join(env), "project=P{:08d}".format(rng.randrange(1 << 24))]
+
+    return fields
+
+def make_records(job_num, pbs_server, rng, settings, now, state = None):
+    fields = make_job(job_num, pbs_server, rng, settings, now, state)
+
+    if rng.random() >= settings.array_fraction:
+        return ["|-".join(fields)]
+
+    parent_id = f"{job_num}[].{pbs_server}"
+    records = ["|-".join([f"Job Id: {parent_id}", "array=True"] + fields[1:])]
+
+    for index in range(1, settings.array_size + 1):
+        records.append("|-".join([f"Job Id: {job_num}[{index}].{pbs_server}", f"array_id={parent_id}",
+                                  f"array_index={index}"] + fields[1:]))
+
+    return records
+
+def write_dataset(path, settings):
+    rng = random.Random(settings.seed)
+    now = int(time.time())
+    job_num = settings.first_id
+    active, history = [], []
+
+    os.makedirs(path, exist_ok = True)
+
+    # History holds finished jobs ahead of everything still active
+    for _ in range(settings.history):
+        job_num += 1 + rng.randrange(3)
+        history += make_records(job_num, settings.server, rng, settings, now, "F")
+
+    for _ in range(settings.jobs):
+        job_num += 1 + rng.randrange(3)
+        active += make_records(job_num, settings.server, rng, settings, now)
+
+    with open(f"{path}/active.dsv", "w") as df:
+        df.write("\n".join(active) + "\n")
+
+    with open(f"{path}/history.dsv", "w") as df:
+        df.write("\n".join(history + active) + "\n")
+
+    with open(f"{path}/age.json", "w") as af:
+        json.dump({ "pbs_version" : "2022.1.3", "pbs_server" : settings.server }, af)
+
+    return len(active), len(history) + len(active)
+
+def add_dataset_args(parser):
+    parser.add_argument("--jobs", type = int, default = 10000, help = "number of active jobs (default: 10000)")
+    parser.add_argument("--history", type = int, default = 50000, help = "number of finished jobs in history (default: 50000)")
+    parser.add_argument("--array-fraction", type = float, default = 0.02, help = "fraction of jobs that are arrays (default: 0.02)")
+    parser.add_argument("--array-size", type = int, default = 10, help = "subjobs per array job (default: 10)")
+    parser.add_argument("--env-vars", type = int, default = 40, help = "extra entries per Variable_List (default: 40)")
+    parser.add_argument("--users", type = int, default = 500, help = "number of distinct job owners (default: 500)")
+    parser.add_argument("--server", default = "benchpbs", help = "PBS server name (default: benchpbs)")
+    parser.add_argument("--first-id", type = int, default = 1000000, help = "first job number (default: 1000000)")
+    parser.add_argument("--seed", type = int, default = 1, help = "random seed (default: 1)")
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog = "dataset", description = "Generate a synthetic PBS dataset for benchmarks.")
+    parser.add_argument("path", help = "output directory")
+    add_dataset_args(parser)
+    return parser
+
+def main():
+    settings = get_parser().parse_args()
+    active, history = write_dataset(settings.path, settings)
+    print(f"Wrote {active} active and {history} history records to {settings.path}")
+
+if __name__ == "__main__":
+    main()
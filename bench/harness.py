@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+import os, re, sys, json, random, argparse, tempfile, subprocess
+from datetime import datetime
+from timeit import default_timer as timer
+
+my_root = os.path.dirname(os.path.realpath(__file__)).rsplit("/", 1)[0]
+sys.path.insert(0, f"{my_root}/src")
+
+from qscache import qscache, gen_data
+import dataset
+
+BENCH_SERVER = "bench"
+
+BENCH_CONFIG = """[paths]
+Temp = {work}/temp
+Data = {work}/cache
+
+[cache]
+MaxWait = 5
+MaxAge = 86400
+Prerender = {prerender}
+
+[history]
+MaxAge = 86400
+
+[pbs]
+Qstat = {root}/bench/qstat
+Prefix =
+
+[servermap]
+{server} = {pbs_server}
+"""
+
+# Query shapes to time; {id}, {ids} and {user} are filled from the dataset
+MODES = { "default"     : [],
+          "alt"         : ["-a"],
+          "wide"        : ["-w"],
+          "user"        : ["-u", "{user}"],
+          "start"       : ["-T"],
+          "id"          : ["{id}"],
+          "multi-id"    : ["{ids}"],
+          "full"        : ["-f"],
+          "full-id"     : ["-f", "{id}"],
+          "json"        : ["-f", "-F", "json"],
+          "dsv"         : ["-f", "-F", "dsv"],
+          "history"     : ["-x"],
+          "history-id"  : ["-x", "{id}"] }
+
+def get_config_path(work_path):
+    return f"{work_path}/{BENCH_SERVER}.cfg"
+
+def use_bench_config(work_path):
+    read_config = qscache.read_config
+
+    # The client looks for its config next to the package, so redirect it
+    def bench_config(path, pkg_root, server = "site"):
+        return read_config(get_config_path(work_path), pkg_root, server)
+
+    qscache.read_config = bench_config
+    os.environ["QSCACHE_SERVER"] = BENCH_SERVER
+    os.environ["QSCACHE_BENCH_DATA"] = f"{work_path}/dataset"
+
+def setup(work_path, settings):
+    if not os.path.isfile(f"{work_path}/dataset/active.dsv"):
+        active, history = dataset.write_dataset(f"{work_path}/dataset", settings)
+        print(f"Generated {active} active and {history} history records in {work_path}/dataset")
+
+    with open(get_config_path(work_path), "w") as cf:
+        cf.write(BENCH_CONFIG.format(work = work_path, root = my_root, server = BENCH_SERVER, pbs_server = settings.server,
+                prerender = settings.prerender))
+
+    use_bench_config(work_path)
+    config = qscache.read_config(get_config_path(work_path), f"{my_root}/src/qscache", BENCH_SERVER)
+    gen_data.check_paths(config)
+
+    return config
+
+def get_samples(work_path, settings):
+    rng = random.Random(settings.seed)
+
+    with open(f"{work_path}/dataset/active.dsv", "r") as df:
+        records = [line.split("|-", 3) for line in df]
+
+    job_ids = [r[0].split(" ")[-1].split(".")[0] for r in records if "[" not in r[0]]
+    users = [r[2].split("=")[1].split("@")[0] for r in records if r[2].startswith("Job_Owner=")]
+
+    return { "id"   : rng.choice(job_ids),
+             "ids"  : " ".join(rng.sample(job_ids, min(10, len(job_ids)))),
+             "user" : rng.choice(users) }
+
+def get_argv(mode, samples):
+    argv = []
+
+    for arg in MODES[mode]:
+        argv += arg.format(**samples).split()
+
+    return argv
+
+def run_query(argv):
+    sys.argv = ["qstat"] + argv
+    qscache.DT_NOW = datetime.now()
+
+    try:
+        qscache.main(use_daemon = False)
+    except SystemExit:
+        pass
+
+def time_query(argv, repeat):
+    samples = []
+    real_stdout = sys.stdout
+
+    with open(os.devnull, "w") as devnull:
+        for _ in range(repeat):
+            sys.stdout = devnull
+            start = timer()
+
+            try:
+                run_query(argv)
+            finally:
+                sys.stdout = real_stdout
+
+            samples.append(timer() - start)
+
+    return samples
+
+def time_cold_query(work_path, argv, repeat):
+    samples = []
+
+    for _ in range(repeat):
+        start = timer()
+        subprocess.run([sys.executable, os.path.realpath(__file__), "--child", work_path, "--"] + argv, stdout = subprocess.DEVNULL)
+        samples.append(timer() - start)
+
+    return samples
+
+def time_cycle(config, cycle, repeat, rebuild):
+    samples = []
+
+    for _ in range(repeat):
+        # Drop cached records and published data to force a full regeneration
+        if rebuild:
+            gen_data.record_cache.clear()
+
+            try:
+                os.remove(qscache.get_data_path(config, BENCH_SERVER, cycle, "current"))
+            except FileNotFoundError:
+                pass
+
+        start = timer()
+        gen_data.run_cache_cycle(config, BENCH_SERVER, cycle)
+        samples.append(timer() - start)
+
+    return samples
+
+def get_written_bytes(config, cycle):
+    generation = qscache.read_generation(config, BENCH_SERVER, cycle)
+    written = 0
+
+    # Files shared with the previous generation are hard links
+    for entry in os.scandir(generation):
+        stat = entry.stat()
+
+        if stat.st_nlink == 1:
+            written += stat.st_size
+
+    return written
+
+def time_tick(config, work_path, repeat):
+    dataset_path = f"{work_path}/dataset/active.dsv"
+    samples, written = [], []
+
+    with open(dataset_path, "r") as df:
+        lines = df.readlines()
+
+    # On a live system every running job's usage changes between cycles
+    try:
+        for tick in range(1, repeat + 1):
+            with open(dataset_path, "w") as df:
+                for line in lines:
+                    if "|-job_state=R|-" in line:
+                        line = re.sub(r"resources_used\.walltime=[^|]*", "resources_used.walltime=99:{:02d}:00".format(tick % 60), line)
+
+                    df.write(line)
+
+            samples += time_cycle(config, "active", 1, False)
+            written.append(get_written_bytes(config, "active"))
+    finally:
+        with open(dataset_path, "w") as df:
+            df.writelines(lines)
+
+        gen_data.run_cache_cycle(config, BENCH_SERVER, "active")
+
+    return samples, written
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def summarize(name, samples):
+    return { "name"     : name,
+             "count"    : len(samples),
+             "mean"     : sum(samples) / len(samples),
+             "p50"      : percentile(samples, 50),
+             "p90"      : percentile(samples, 90),
+             "p99"      : percentile(samples, 99),
+             "max"      : max(samples),
+             "rate"     : len(samples) / sum(samples) }
+
+def print_results(results):
+    print("{:24} {:>6} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10}".format("benchmark", "runs", "mean ms",
+            "p50 ms", "p90 ms", "p99 ms", "max ms", "ops/s"))
+
+    for r in results:
+        print("{:24} {:>6} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.1f}".format(r["name"], r["count"],
+                r["mean"] * 1000, r["p50"] * 1000, r["p90"] * 1000, r["p99"] * 1000, r["max"] * 1000, r["rate"]))
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog = "harness", description = "Time qstat queries and cache cycles against synthetic data.")
+    parser.add_argument("--workdir", help = "directory for dataset, config and cache (default: new temporary directory)")
+    parser.add_argument("--repeat", type = int, default = 20, help = "timed runs per query mode (default: 20)")
+    parser.add_argument("--cycles", type = int, default = 3, help = "timed runs per cache cycle (default: 3)")
+    parser.add_argument("--modes", default = ",".join(MODES), help = "comma-separated query modes to time")
+    parser.add_argument("--prerender", default = "", help = "space-separated Prerender kinds for active cycles (default: none)")
+    parser.add_argument("--cold", action = "store_true", help = "also time each query in a fresh interpreter")
+    parser.add_argument("--json", help = "write results to this file for later comparison")
+    dataset.add_dataset_args(parser)
+    return parser
+
+def main():
+    # Single query in a fresh process, used for cold-start timings
+    if len(sys.argv) > 3 and sys.argv[1] == "--child":
+        use_bench_config(sys.argv[2])
+        run_query(sys.argv[4:])
+        return
+
+    settings = get_parser().parse_args()
+    work_path = os.path.realpath(settings.workdir or tempfile.mkdtemp(prefix = "qscache-bench-"))
+    config = setup(work_path, settings)
+    results = []
+
+    for cycle in ["active", "history"]:
+        results.append(summarize(f"gen_data {cycle} rebuild", time_cycle(config, cycle, settings.cycles, True)))
+        results.append(summarize(f"gen_data {cycle} no-op", time_cycle(config, cycle, settings.cycles, False)))
+
+    samples, written = time_tick(config, work_path, settings.cycles)
+    results.append(summarize("gen_data active tick", samples))
+
+    samples = get_samples(work_path, settings)
+
+    for mode in settings.modes.split(","):
+        argv = get_argv(mode, samples)
+        results.append(summarize(mode, time_query(argv, settings.repeat)))
+
+        if settings.cold:
+            results.append(summarize(f"{mode} (cold)", time_cold_query(work_path, argv, settings.repeat)))
+
+    print_results(results)
+    print("\ngen_data active tick wrote {:.2f} MB per cycle".format(sum(written) / len(written) / 1e6))
+
+    if settings.json:
+        with open(settings.json, "w") as jf:
+            json.dump({ "settings" : vars(settings), "results" : results, "tick_written" : written }, jf, indent = 4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+from importlib import import_module
+
+# Compressed data files hold runs of whole records, each run compressed on its
+# own so a reader only inflates the blocks holding the jobs it wants:
+#
+#   qsblocks <version> <codec>
+#   <compressed length>
+#   <compressed block>
+#   ...
+#
+# Index offsets into these files are virtual: the file offset of the block,
+# shifted left by BLOCK_SHIFT, plus the record's offset inside the block.
+
+BLOCKS_VERSION = "1"
+BLOCK_SHIFT = 32
+# Codec modules are imported on first use to keep client startup lean
+CODECS = ("zlib", "lzma")
+
+def write_blocks(path, lines, codec, block_size):
+    compress = import_module(codec).compress
+    locations = []
+
+    with open(path, "wb") as block_file:
+        block_file.write("qsblocks {} {}\n".format(BLOCKS_VERSION, codec).encode())
+        block, block_offset, block_length = [], block_file.tell(), 0
+
+        for n, line in enumerate(lines):
+            locations.append(((block_offset << BLOCK_SHIFT) + block_length, len(line)))
+            block.append(line)
+            block_length += len(line)
+
+            if block_length >= block_size or n == len(lines) - 1:
+                data = compress(b"".join(block))
+                block_file.write(b"%d\n" % len(data) + data)
+                block, block_offset, block_length = [], block_file.tell(), 0
+
+    return locations
+
+def get_codec(block_file):
+    block_file.seek(0)
+    header = block_file.read(64).split(b"\n")[0].split()
+    block_file.seek(0)
+
+    if len(header) == 3 and header[0] == b"qsblocks" and header[1].decode() == BLOCKS_VERSION:
+        if header[2].decode() in CODECS:
+            return header[2].decode()
+
+    return None
+
+def read_block(block_file, block_offset, decompress):
+    block_file.seek(block_offset)
+    return decompress(block_file.read(int(block_file.readline())))
+
+def read_lines(block_file):
+    codec = get_codec(block_file)
+
+    if codec is None:
+        yield from block_file
+        return
+
+    decompress = import_module(codec).decompress
+    block_file.readline()
+
+    while True:
+        size = block_file.readline()
+
+        if not size:
+            break
+
+        yield from decompress(block_file.read(int(size))).splitlines(keepends = True)
+
+def read_records(block_file, locations):
+    decompress = import_module(get_codec(block_file)).decompress
+    block_offset, block = None, b""
+
+    # Locations are sorted, so each block is inflated at most once
+    for offset, length in locations:
+        if offset >> BLOCK_SHIFT != block_offset:
+            block_offset = offset >> BLOCK_SHIFT
+            block = read_block(block_file, block_offset, decompress)
+
+        start = offset & ((1 << BLOCK_SHIFT) - 1)
+        yield block[start:start + length]
+
+# Array subjobs repeat most of their parent's fields, so a subjob stored right
+# after its parent (the last record not stored this way) keeps only its own
+# fields and ranges of the parent's fields, marked by an empty "@" field:
+#
+#   Job Id: 123[4].server|-@|-array_index=4|-@2-17|-job_state=R|-@19-40
+#
+# gen_data packs bytes records; readers unpack either bytes or str records
+
+def get_separators(line):
+    return ("|-", "@", "-", "\n") if isinstance(line, str) else (b"|-", b"@", b"-", b"\n")
+
+def is_subjob(job_id):
+    start = job_id.find("[" if isinstance(job_id, str) else b"[")
+    return start >= 0 and job_id[start + 1:start + 2].isdigit()
+
+def get_parent_id(job_id):
+    start, end = (job_id.find(c if isinstance(job_id, str) else c.encode()) for c in "[]")
+    return job_id[:start + 1] + job_id[end:]
+
+def is_packed(line):
+    sep, mark, _, _ = get_separators(line)
+    start = line.find(sep) + len(sep)
+    return line[start:start + 1] == mark
+
+def get_positions(parent):
+    positions = {}
+
+    for n, field in enumerate(parent.rstrip(b"\n").split(b"|-")):
+        positions.setdefault(field, n)
+
+    return positions
+
+def pack_subjob(line, positions):
+    body = line.rstrip(b"\n")
+    fields = body.split(b"|-")
+    packed, start, end = [fields[0], b"@"], None, None
+
+    for field in fields[1:]:
+        n = positions.get(field)
+
+        if start is not None and n == end + 1:
+            end = n
+            continue
+
+        if start is not None:
+            packed.append(b"@%d-%d" % (start, end))
+
+        start = end = n
+
+        if n is None:
+            packed.append(field)
+
+    if start is not None:
+        packed.append(b"@%d-%d" % (start, end))
+
+    return b"|-".join(packed) + line[len(body):]
+
+def unpack_subjob(line, parent_fields):
+    sep, mark, dash, newline = get_separators(line)
+    body = line.rstrip(newline)
+    fields = body.split(sep)
+    unpacked = [fields[0]]
+
+    for field in fields[2:]:
+        if field.startswith(mark):
+            start, end = field[1:].split(dash)
+            unpacked += parent_fields[int(start):int(end) + 1]
+        else:
+            unpacked.append(field)
+
+    return sep.join(unpacked) + line[len(body):]
+
+def expand_records(lines, subjobs = True):
+    parent, parent_fields = None, None
+
+    for line in lines:
+        if is_packed(line):
+            # Callers that filter out subjobs never pay for unpacking them
+            if subjobs:
+                if parent_fields is None:
+                    sep, _, _, newline = get_separators(parent)
+                    parent_fields = parent.rstrip(newline).split(sep)
+
+                yield unpack_subjob(line, parent_fields)
+        else:
+            parent, parent_fields = line, None
+            yield line
+
+class block_reader:
+    # Reads single records, inflating a block only when a read leaves the last
+    def __init__(self, block_file):
+        codec = get_codec(block_file)
+
+        self.block_file = block_file
+        self.decompress = import_module(codec).decompress if codec else None
+        self.block_offset, self.block = None, b""
+
+    def read(self, offset, length):
+        if self.decompress is None:
+            self.block_file.seek(offset)
+            return self.block_file.read(length)
+
+        if offset >> BLOCK_SHIFT != self.block_offset:
+            self.block_offset = offset >> BLOCK_SHIFT
+            self.block = read_block(self.block_file, self.block_offset, self.decompress)
+
+        start = offset & ((1 << BLOCK_SHIFT) - 1)
+        return self.block[start:start + length]
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+import os, sys, io, json, socket, socketserver, struct, pwd, gc, bisect
+from datetime import datetime
+
+from qscache import qscache, blocks
+from qscache.index import SECONDARY_KEYS, field_value, secondary_key
+
+class daemon_fallback(Exception):
+    pass
+
+class job_snapshot:
+    def __init__(self, config, server, source):
+        self.config, self.server, self.source = config, server, source
+        self.signature = None
+        self.lines, self.jobs = [], []
+
+    def current_signature(self):
+        # Generations are immutable, so the one published is all that can change
+        generation = qscache.read_generation(self.config, self.server, self.source)
+
+        if generation is None:
+            raise FileNotFoundError(qscache.get_data_path(self.config, self.server, self.source, "current"))
+
+        return generation
+
+    def load(self):
+        signature = self.current_signature()
+
+        with open(f"{signature}/age", "r") as uf:
+            server_info = json.load(uf)
+
+        with open(f"{signature}/dat", "r", errors = "ignore") as data_file:
+            records = blocks.expand_records(blocks.read_lines(data_file.buffer))
+            lines = [line.decode(data_file.encoding, errors = "ignore") for line in records]
+            lines = [line for line in lines if line.strip()]
+
+        job_ids = [line[:line.find("|-")].split(" ")[-1] for line in lines]
+        keys = {}
+
+        # Parse once here so forked handlers share the result rather than redo
+        # it, and carry over records that are unchanged since the last load
+        previous = dict(zip(self.lines, self.jobs)) if self.signature else {}
+        jobs = [previous[line] if line in previous else qscache.parse_job(line) for line in lines]
+
+        for position, line in enumerate(lines):
+            record = line.encode(errors = "ignore")
+
+            for kind, field in SECONDARY_KEYS:
+                value = field_value(record, field)
+
+                if kind == "owner":
+                    value = value.split(b"@")[0] if value and b"@" in value else None
+
+                if value:
+                    keys.setdefault(secondary_key(kind, value.decode(errors = "ignore")), []).append(position)
+
+        self.server_info, self.lines, self.jobs, self.keys = server_info, lines, jobs, keys
+        self.sorted_ids = sorted((job_id, position) for position, job_id in enumerate(job_ids))
+        self.job_ids = job_ids
+        self.parent_positions = [position for position, job_id in enumerate(job_ids) if not blocks.is_subjob(job_id)]
+        self.signature = signature
+
+    def refresh(self):
+        try:
+            if self.current_signature() != self.signature:
+                self.load()
+                return True
+        except (OSError, ValueError):
+            self.signature = None
+
+        return False
+
+    def find_positions(self, select_ids, select_keys):
+        if select_ids:
+            positions = set()
+
+            for sid in select_ids:
+                start = bisect.bisect_left(self.sorted_ids, (sid,))
+
+                while start < len(self.sorted_ids) and self.sorted_ids[start][0].startswith(sid):
+                    positions.add(self.sorted_ids[start][1])
+                    start += 1
+        else:
+            positions = None
+
+            for key_group in select_keys:
+                found = set()
+
+                for key in key_group:
+                    found.update(self.keys.get(key, []))
+
+                positions = found if positions is None else positions & found
+
+        return sorted(positions)
+
+    def get_jobs(self, process_env, select_ids = None, select_keys = None, subjobs = True):
+        if select_ids or select_keys:
+            positions = self.find_positions(select_ids, select_keys)
+
+            if not subjobs:
+                positions = [position for position in positions if not blocks.is_subjob(self.job_ids[position])]
+        elif subjobs:
+            positions = range(len(self.lines))
+        else:
+            positions = self.parent_positions
+
+        for position in positions:
+            # Full output edits records in place, so give it a private copy
+            if process_env:
+                yield self.job_ids[position], qscache.parse_job(self.lines[position], True)
+            else:
+                yield self.job_ids[position], self.jobs[position]
+
+class query_handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        creds = self.request.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        _, peer_uid, _ = struct.unpack("3i", creds)
+        request = json.loads(self.rfile.readline().decode())
+
+        # Handlers run in a forked child, so process-wide state is ours to change
+        sys.argv = ["qstat"] + request["argv"]
+
+        for key in ("QSCACHE_DEBUG", "QSCACHE_IGNORE_AGE"):
+            if key in request["env"]:
+                os.environ[key] = request["env"][key]
+            else:
+                os.environ.pop(key, None)
+
+        qscache.DT_NOW = datetime.now()
+        qscache.snapshots = self.server.snapshots
+        qscache.generations = {key : snapshot.signature for key, snapshot in self.server.snapshots.items()}
+        qscache.bypass_cache = self.fallback
+        sys.stdout, sys.stderr = io.StringIO(), io.StringIO()
+
+        try:
+            try:
+                status = qscache.main(user = pwd.getpwuid(peer_uid).pw_name, use_daemon = False)
+            except SystemExit as exit_code:
+                status = exit_code.code or 0
+
+            job_output, messages = sys.stdout.getvalue(), sys.stderr.getvalue()
+            reply = { "status" : status, "stderr" : messages }
+        except daemon_fallback as reason:
+            job_output, reply = "", { "fallback" : str(reason) }
+
+        self.wfile.write(json.dumps(reply).encode() + b"\n")
+        self.wfile.write(job_output.encode(request["encoding"] or "utf-8", errors = "replace"))
+
+    def fallback(self, config, reason, delay = 1):
+        raise daemon_fallback(reason)
+
+class query_server(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    def __init__(self, socket_path, snapshots):
+        self.snapshots = {}
+        self.known_snapshots = snapshots
+        self.refresh_snapshots()
+
+        super().__init__(socket_path, query_handler)
+
+    def refresh_snapshots(self):
+        reloaded = False
+
+        for key, snapshot in self.known_snapshots.items():
+            reloaded = snapshot.refresh() or reloaded
+
+            if snapshot.signature:
+                self.snapshots[key] = snapshot
+            else:
+                self.snapshots.pop(key, None)
+
+        # Keep the collector from touching (and copying) shared pages in children
+        if reloaded and hasattr(gc, "freeze"):
+            gc.freeze()
+
+    def service_actions(self):
+        super().service_actions()
+        self.refresh_snapshots()
+
+def main():
+    my_root = os.path.dirname(os.path.realpath(__file__))
+
+    try:
+        server = os.environ["QSCACHE_SERVER"]
+    except KeyError:
+        server = "site"
+
+    config = qscache.read_config("{}/cfg/{}.cfg".format(my_root, server), my_root, server)
+    socket_path = config["daemon"]["socket"]
+
+    if not socket_path:
+        print("Error: 'Socket' key missing from daemon settings", file = sys.stderr)
+        sys.exit(1)
+
+    # Serve every mapped server whose cache lives in this data path
+    snapshots = {}
+
+    for data_server in config["servermap"]:
+        for source in config["daemon"]["sources"].split():
+            snapshots[data_server, source] = job_snapshot(config, data_server, source)
+
+    try:
+        os.remove(socket_path)
+    except FileNotFoundError:
+        pass
+
+    with query_server(socket_path, snapshots) as daemon:
+        os.chmod(socket_path, 0o666)
+        daemon.serve_forever(poll_interval = 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import os, sys, glob, time, signal, shutil, argparse, multiprocessing
+from datetime import datetime
+
+from qscache import gen_data
+from qscache.qscache import read_config
+
+# One long-lived worker process per server and cycle keeps its record cache
+# between cycles, while the supervisor restarts any worker that dies, runs
+# past its MaxAge, or whose site config has changed
+
+def cycle_worker(my_root, server, cycle, started):
+    # Lead a process group so a timeout also takes down any running qstat
+    os.setsid()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    config = read_config("{}/cfg/{}.cfg".format(my_root, server), my_root, server)
+    gen_data.check_paths(config)
+    cycle_temp = "{}/qscache-{}".format(config["paths"]["temp"], config["run"]["pid"])
+
+    while gen_data.wait_for_cycle(config, server, cycle, float("inf")):
+        if config["paths"]["logs"]:
+            config["run"]["log"] = "{}/PBS-{}-{}.log".format(config["paths"]["logs"], server.upper(),
+                    datetime.now().strftime("%Y%m%d"))
+
+        started.value = time.time()
+        gen_data.generate_cycle(config, server, cycle, cycle_temp)
+        started.value = 0
+        shutil.rmtree(cycle_temp, ignore_errors = True)
+
+class cycle_supervisor:
+    def __init__(self, my_root, servers, cycles):
+        self.my_root = my_root
+        self.workers = {}
+
+        for server in servers:
+            for cycle in cycles:
+                self.workers[server, cycle] = { "process" : None, "started" : multiprocessing.Value("d", 0) }
+
+    def get_config_mtime(self, server):
+        try:
+            return os.stat("{}/cfg/{}.cfg".format(self.my_root, server)).st_mtime_ns
+        except OSError:
+            return None
+
+    def start(self, server, cycle):
+        worker = self.workers[server, cycle]
+        worker["started"].value = 0
+        worker["spawned"] = time.time()
+        worker["mtime"] = self.get_config_mtime(server)
+        worker["config"] = read_config("{}/cfg/{}.cfg".format(self.my_root, server), self.my_root, server)
+        worker["process"] = multiprocessing.Process(target = cycle_worker, name = f"gen_data-{server}-{cycle}",
+                args = (self.my_root, server, cycle, worker["started"]), daemon = True)
+        worker["process"].start()
+
+    def stop(self, server, cycle):
+        process = self.workers[server, cycle]["process"]
+
+        if process.is_alive():
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except OSError:
+                process.kill()
+
+        process.join()
+        shutil.rmtree("{}/qscache-{}".format(self.workers[server, cycle]["config"]["paths"]["temp"], process.pid), ignore_errors = True)
+
+    def check(self, server, cycle):
+        worker = self.workers[server, cycle]
+        max_age = int(worker["config"][cycle]["maxage"])
+        started = worker["started"].value
+
+        if not worker["process"].is_alive():
+            # Give a failing worker a cycle's rest before trying again
+            if time.time() - worker["spawned"] < int(worker["config"][cycle]["frequency"]):
+                return
+
+            reason = "exited with status {}".format(worker["process"].exitcode)
+        elif started and time.time() - started >= max_age:
+            reason = f"exceeded MaxAge of {max_age} seconds"
+        elif worker["mtime"] != self.get_config_mtime(server):
+            reason = "site config changed"
+        else:
+            return
+
+        print("{} {} {} cycle {}; restarting".format(datetime.now().strftime("%H:%M:%S"), server, cycle, reason), file = sys.stderr)
+        self.stop(server, cycle)
+        self.start(server, cycle)
+
+    def run(self):
+        for server, cycle in self.workers:
+            self.start(server, cycle)
+
+        while True:
+            time.sleep(1)
+
+            for server, cycle in self.workers:
+                self.check(server, cycle)
+
+    def shutdown(self):
+        for server, cycle in self.workers:
+            if self.workers[server, cycle]["process"]:
+                self.stop(server, cycle)
+
+def main():
+    my_root = os.path.dirname(os.path.realpath(__file__))
+
+    parser = argparse.ArgumentParser(prog = "gen_daemon", description = "Generate cache data for several servers continuously.")
+    parser.add_argument("servers", nargs = "*", help = "site config names to serve (default: all in the cfg directory)")
+    parser.add_argument("--cycles", default = "active,history", help = "comma-separated cycles to run (default: active,history)")
+    args = parser.parse_args()
+
+    servers = args.servers or sorted(os.path.basename(path)[:-4] for path in glob.glob(f"{my_root}/cfg/*.cfg"))
+
+    if not servers:
+        print("Error: no site configs found to serve", file = sys.stderr)
+        sys.exit(1)
+
+    supervisor = cycle_supervisor(my_root, servers, args.cycles.split(","))
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+
+    try:
+        supervisor.run()
+    finally:
+        supervisor.shutdown()
+
+if __name__ == "__main__":
+    main()
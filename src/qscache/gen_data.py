@@ -1,9 +1,29 @@
 #!/usr/bin/env python3
 
-import sys, os, signal, time, argparse, subprocess, shutil, socket, random
+import sys, os, io, signal, time, argparse, subprocess, shutil, socket, random, marshal
 from datetime import datetime
 from timeit import default_timer as timer
 
+from qscache import blocks
+from qscache.index import SECONDARY_KEYS, record_key, field_value, secondary_key, write_index, open_index, search_index
+
+# Listings rendered once per active cycle for the most common query shapes
+COLUMN_VIEWS = {    "default"       : [],
+                    "default-wide"  : ["-w"],
+                    "alt"           : ["-a"],
+                    "alt-wide"      : ["-a", "-w"]  }
+
+# Each job can be pre-rendered for -F json and -f output; -f is stored in its
+# wide layout, which clients wrap when -w is not given
+FRAGMENT_KINDS = ("json", "full")
+
+# Time fields stored as epoch seconds so clients need not parse them
+TIME_FIELDS = ("stime", "qtime", "etime", "mtime", "estimated.start_time")
+
+# Per-record work carried between cycles, keyed by (server, cycle) and then job
+# ID, so that only records which changed since the last cycle are re-derived
+record_cache = {}
+
 def check_paths(config):
     for path in ["data", "temp", "logs"]:
         if path != "logs" or config["paths"][path]:
@@ -14,6 +34,557 @@ def check_paths(config):
                     print("Error: cannot create {} path ({})".format(path, config["paths"][path]), file = sys.stderr)
                     sys.exit(1)
 
+def read_records(data_path):
+    records = []
+
+    with open(data_path, "rb") as data_file:
+        for line in blocks.expand_records(blocks.read_lines(data_file)):
+            job_id = record_key(line)
+
+            if job_id:
+                records.append((job_id.decode(errors = "ignore"), line))
+
+    return records
+
+def get_previous_records(config, server, cycle):
+    from qscache.qscache import read_generation
+
+    previous = record_cache.get((server, cycle))
+
+    # On a cold start, diff against the snapshot that is already published
+    if previous is None:
+        generation = read_generation(config, server, cycle)
+
+        try:
+            previous = {job_id : {"line" : line} for job_id, line in read_records(f"{generation}/dat")}
+        except OSError:
+            return {}
+
+        kinds = get_fragment_kinds(config, cycle)
+
+        for job_id, fragments in read_fragments(generation, kinds).items():
+            if job_id in previous and len(fragments) == len(kinds):
+                previous[job_id]["fragments"] = fragments
+
+    return previous
+
+def get_fragment_kinds(config, cycle):
+    return [kind for kind in FRAGMENT_KINDS if kind in config[cycle]["prerender"].split()]
+
+def read_fragments(generation, kinds):
+    loaded = {}
+
+    # Rendering every job again costs far more than reading what was published
+    for kind in kinds:
+        try:
+            with open(f"{generation}/{kind}", "rb") as ff:
+                fragment_index = open_index(f"{generation}/{kind}.idx", os.fstat(ff.fileno()).st_size)
+
+                if fragment_index is None:
+                    return {}
+
+                with fragment_index[0]:
+                    reader = blocks.block_reader(ff)
+
+                    for offset, length, key in search_index(fragment_index, [""]):
+                        loaded.setdefault(key.decode(errors = "ignore"), {})[kind] = reader.read(offset, length)
+        except (OSError, ValueError, IndexError):
+            return {}
+
+    return loaded
+
+def get_record_keys(job_id, line):
+    keys = []
+
+    for kind, field in SECONDARY_KEYS:
+        value = field_value(line, field)
+
+        if kind == "owner":
+            value = value.split(b"@")[0] if value and b"@" in value else None
+
+        if value:
+            keys.append(secondary_key(kind, value.decode(errors = "ignore"), job_id))
+
+    return keys
+
+def get_record_times(line):
+    times = {}
+
+    for field in TIME_FIELDS:
+        value = field_value(line, "|-{}=".format(field).encode())
+
+        if value:
+            try:
+                times[field] = int(datetime.strptime(value.decode(errors = "ignore"), "%c").timestamp())
+            except ValueError:
+                pass
+
+    return times
+
+def render_fragments(job_id, text, kinds):
+    from qscache import qscache
+
+    job_info, fragments = qscache.parse_job(text, True), {}
+    client_output = qscache.output
+
+    try:
+        for kind in kinds:
+            if kind == "json":
+                fragments[kind] = qscache.json_fragment(job_id, job_info).encode()
+            else:
+                buffer = io.StringIO()
+                qscache.output = qscache.output_buffer(buffer, float("inf"))
+
+                # Full output escapes Variable_List in place, so give it a copy
+                if isinstance(job_info.get("Variable_List"), dict):
+                    qscache.full_output(job_id, dict(job_info, Variable_List = dict(job_info["Variable_List"])), True)
+                else:
+                    qscache.full_output(job_id, job_info, True)
+
+                qscache.output.flush()
+                fragments[kind] = buffer.getvalue().encode()
+    finally:
+        qscache.output = client_output
+
+    return fragments
+
+def ingest_records(config, server, cycle, stream, data_file, views = None):
+    from qscache.qscache import parse_job
+
+    previous = get_previous_records(config, server, cycle)
+    kinds = get_fragment_kinds(config, cycle)
+    records, locations, cache, changes = [], [], {}, 0
+    offset, parent, parent_id, positions = 0, None, None, None
+
+    # Records are diffed and derived as qstat emits them, so that little is
+    # left to do once the command exits
+    for line in stream:
+        job_id = record_key(line)
+        stored = line
+
+        # Subjobs that follow their parent are stored as ranges of its fields
+        if blocks.is_subjob(job_id) and parent_id == blocks.get_parent_id(job_id):
+            if positions is None:
+                positions = blocks.get_positions(parent)
+
+            stored = blocks.pack_subjob(line, positions)
+        else:
+            parent, parent_id, positions = line, job_id, None
+
+        data_file.write(stored)
+
+        if job_id:
+            job_id = job_id.decode(errors = "ignore")
+            entry = previous.get(job_id)
+
+            if entry is None or entry["line"] != line:
+                changes += 1
+                entry = {"line" : line}
+
+            if "keys" not in entry:
+                entry["keys"] = get_record_keys(job_id, line)
+                entry["times"] = get_record_times(line)
+
+            if "fragments" not in entry:
+                entry["fragments"] = render_fragments(job_id, line.decode(errors = "ignore"), kinds)
+
+            if views and "info" not in entry:
+                entry["info"] = parse_job(line.decode(errors = "ignore"), projection = views["projection"])
+                entry["rows"] = {view : render_row(views["server"], job_id, entry["info"], args) for view, args in views["args"].items()}
+
+            records.append((job_id, line))
+            locations.append((offset, len(stored)))
+            cache[job_id] = entry
+
+        offset += len(stored)
+
+    for job_id in previous:
+        if job_id not in cache:
+            changes += 1
+
+    record_cache[server, cycle] = cache
+
+    return records, locations, cache, changes
+
+def index_cycle_data(records, cache, index_path, keys_path, locations, data_size):
+    entries, key_entries = [], []
+
+    for (job_id, line), (offset, length) in zip(records, locations):
+        entry = cache[job_id]
+        entries.append((job_id, offset, length))
+        key_entries += [(key, offset, length) for key in entry["keys"]]
+
+    write_index(index_path, entries, data_size)
+    write_index(keys_path, key_entries, data_size)
+
+def write_fragments(records, cache, fragment_prefix, kind, codec, block_size):
+    fragments = [cache[job_id]["fragments"][kind] for job_id, _ in records]
+    fragment_path = f"{fragment_prefix}.{kind}"
+
+    # Clients copy these as they are instead of rendering each job; they are
+    # compressed even when the cycle data is not, as they are several times
+    # the size of the data file
+    codec = codec if codec in blocks.CODECS else "zlib"
+    locations = blocks.write_blocks(fragment_path, fragments, codec, block_size)
+
+    write_index(f"{fragment_path}.idx", [(job_id, offset, length) for (job_id, _), (offset, length) in zip(records, locations)],
+            os.path.getsize(fragment_path))
+
+def write_finished(records, cache, path):
+    entries = []
+
+    # Clients check IDs missing from the active data here rather than in the
+    # history data, so keys hold the fields that check_job filters on
+    for position, (job_id, line) in enumerate(records):
+        entry = cache[job_id]
+
+        if "finished" not in entry:
+            state, owner = (field_value(line, field) or b"" for field in (b"|-job_state=", b"|-Job_Owner="))
+            entry["finished"] = "{}:{}:{}".format(job_id, state.decode(errors = "ignore"), owner.decode(errors = "ignore"))
+
+        entries.append((entry["finished"], position, 0))
+
+    write_index(path, entries, 0)
+
+def write_times(records, cache, prefix):
+    tables = {field : {} for field in TIME_FIELDS}
+
+    for job_id, _ in records:
+        for field, epoch in cache[job_id]["times"].items():
+            tables[field][job_id] = epoch
+
+    # One table per field, so clients load only the field they format
+    for field, table in tables.items():
+        with open(f"{prefix}.times.{field}", "wb") as tf:
+            marshal.dump(table, tf)
+
+def write_privileges(config, records, path):
+    import grp, pwd
+    from qscache.qscache import get_privilege_settings, get_privilege_level
+
+    settings = get_privilege_settings(config)
+    users = set(settings[0].split() + settings[2].split())
+    groups = {}
+
+    # Resolve each listed group once per cycle rather than every user's groups,
+    # so membership changes apply by the next cycle at little lookup cost
+    for group in set(settings[1].split() + settings[3].split()) - {"*"}:
+        try:
+            entry = grp.getgrnam(group)
+        except KeyError:
+            continue
+
+        groups[group] = (entry.gr_gid, set(entry.gr_mem))
+        users.update(entry.gr_mem)
+
+    # Cover everyone with jobs, plus listed users and members of listed groups
+    for _, line in records:
+        owner = field_value(line, b"|-Job_Owner=")
+
+        if owner and b"@" in owner:
+            users.add(owner.split(b"@")[0].decode(errors = "ignore"))
+
+    users.discard("*")
+    table = {}
+
+    for user in users:
+        my_groups = [group for group, (_, members) in groups.items() if user in members]
+
+        # Members through their primary group are not listed in the group entry
+        if len(my_groups) < len(groups):
+            try:
+                primary_gid = pwd.getpwnam(user).pw_gid
+            except KeyError:
+                primary_gid = None
+
+            my_groups += [group for group, (gid, members) in groups.items() if gid == primary_gid and user not in members]
+
+        table[user] = get_privilege_level(config, user, my_groups)
+
+    with open(path, "wb") as pf:
+        marshal.dump({ "settings" : settings, "users" : table }, pf)
+
+def get_artifacts(config, cycle):
+    artifacts = ["idx", "sidx"] + [f"times.{field}" for field in TIME_FIELDS]
+
+    for kind in get_fragment_kinds(config, cycle):
+        artifacts += [kind, f"{kind}.idx"]
+
+    if cycle == "history":
+        artifacts.append("fin")
+
+    if cycle == "active":
+        for view, view_args in COLUMN_VIEWS.items():
+            artifacts.append(f"view-{view}")
+
+            if "-a" in view_args:
+                artifacts += [f"view-{view}-users", f"view-{view}-users.idx"]
+
+    return artifacts
+
+def get_views(config, server):
+    from qscache import qscache
+
+    views = { "server" : config["servermap"][server], "args" : {} }
+    fields = ""
+
+    for view, view_args in COLUMN_VIEWS.items():
+        args, _ = qscache.get_parser().parse_known_args(view_args)
+        args.format = qscache.get_column_format(args)
+        views["args"][view] = args
+        fields += args.format
+
+    views["projection"] = qscache.get_projection(fields)
+
+    return views
+
+def render_row(pbs_server, job_id, job_info, args, header = False):
+    from qscache import qscache
+
+    qscache.output = qscache.output_buffer(io.StringIO())
+
+    if qscache.check_job(job_id, job_info, select_queue = f"@{pbs_server}", filters = args):
+        qscache.print_job(job_id, job_info, args, header)
+
+    qscache.output.flush()
+    return qscache.output.stream.getvalue()
+
+def render_views(records, cache, views, view_prefix):
+    jobs, user_jobs = [], {}
+
+    for job_id, line in records:
+        entry = cache[job_id]
+        jobs.append((job_id, entry))
+
+        if "@" in entry["info"].get("Job_Owner", ""):
+            user_jobs.setdefault(entry["info"]["Job_Owner"].split("@")[0], []).append((job_id, entry))
+
+    # Rows are cached per job; only the first row of a listing carries the header
+    def render(view, args, job_list):
+        text = []
+
+        for job_id, entry in job_list:
+            if entry["rows"][view]:
+                text.append(render_row(views["server"], job_id, entry["info"], args, True) if not text else entry["rows"][view])
+
+        return "".join(text).encode()
+
+    for view, args in views["args"].items():
+        with open(f"{view_prefix}.view-{view}", "wb") as view_file:
+            view_file.write(render(view, args, jobs))
+
+        # Views that -u can use also get a section per user
+        if args.a:
+            entries, offset = [], 0
+
+            with open(f"{view_prefix}.view-{view}-users", "wb") as view_file:
+                for user in sorted(user_jobs):
+                    args.u = user
+                    text = render(view, args, user_jobs[user])
+
+                    if text:
+                        view_file.write(text)
+                        entries.append((secondary_key("owner", user), offset, len(text)))
+                        offset += len(text)
+
+            write_index(f"{view_prefix}.view-{view}-users.idx", entries, offset)
+
+def publish_generation(config, server, cycle, generation):
+    from qscache.qscache import get_data_path
+
+    pointer = get_data_path(config, server, cycle, "current")
+    prefix = "{}-{}.".format(server, cycle)
+
+    # Readers resolve the link once, so swapping it publishes everything at once
+    os.symlink(os.path.basename(generation), f"{pointer}.{os.getpid()}")
+    os.replace(f"{pointer}.{os.getpid()}", pointer)
+
+    # Keep the generation just replaced for readers that resolved it already
+    published = sorted(int(name[len(prefix):]) for name in os.listdir(config["paths"]["data"])
+            if name.startswith(prefix) and name[len(prefix):].isdigit())
+    current = int(os.path.basename(generation)[len(prefix):])
+
+    for number in [n for n in published if n < current][:-1]:
+        shutil.rmtree("{}/{}{}".format(config["paths"]["data"], prefix, number), ignore_errors = True)
+
+def take_reads(config, server, cycle, kind = "reads"):
+    from qscache.qscache import get_data_path
+
+    # Clients append a byte per query, so the size is the reads since last cycle
+    reads_path = get_data_path(config, server, cycle, kind)
+
+    try:
+        reads = os.path.getsize(reads_path)
+        os.truncate(reads_path, 0)
+    except FileNotFoundError:
+        reads = 0
+        os.close(os.open(reads_path, os.O_WRONLY | os.O_CREAT))
+        os.chmod(reads_path, 0o666)
+
+    return reads
+
+def get_schedule_path(config, server, cycle):
+    # Servers may share a temp path, so each keeps its own schedule
+    return "{}/{}-{}.schedule".format(config["paths"]["temp"], server, cycle)
+
+def read_schedule(config, server, cycle):
+    try:
+        with open(get_schedule_path(config, server, cycle), "r") as sf:
+            start, interval, qstat_time = sf.read().split()
+            return { "start" : float(start), "interval" : float(interval), "qstat" : float(qstat_time) }
+    except (OSError, ValueError):
+        return None
+
+def write_schedule(config, server, cycle, start, interval, qstat_time):
+    with open(get_schedule_path(config, server, cycle), "w") as sf:
+        sf.write("{} {} {}\n".format(start, interval, qstat_time))
+
+def get_cycle_interval(config, cycle, qstat_time, reads, last_interval):
+    interval = max(int(config[cycle]["frequency"]), qstat_time * float(config[cycle]["loadratio"]))
+
+    # Back off while nobody reads the data, doubling up to the idle frequency
+    if not reads:
+        interval = max(interval, min(2 * last_interval, int(config[cycle]["idlefrequency"])))
+
+    # Never let the data go stale enough that clients bypass the cache
+    return min(interval, max(int(config[cycle]["frequency"]), 0.8 * int(config[cycle]["maxage"]) - qstat_time))
+
+def wait_for_cycle(config, server, cycle, deadline):
+    from qscache.qscache import get_data_path
+
+    schedule = read_schedule(config, server, cycle)
+
+    if not schedule:
+        return True
+
+    # Demand only cancels the idle backoff; scheduler load still sets the pace
+    due = schedule["start"] + schedule["interval"]
+    demand_due = schedule["start"] + max(int(config[cycle]["frequency"]), schedule["qstat"] * float(config[cycle]["loadratio"]))
+    reads_path = get_data_path(config, server, cycle, "reads")
+    stale_path = get_data_path(config, server, cycle, "stale")
+
+    def is_marked(path):
+        return os.path.isfile(path) and os.path.getsize(path) > 0
+
+    # Nothing can come due before the deadline, so leave it to the next run
+    if demand_due >= deadline:
+        return False
+
+    while True:
+        now = time.time()
+
+        # A client reading data we have backed off on, or one served data past
+        # MaxAge, pulls the next cycle in. Any user can mark these files, so
+        # cycles still start no closer together than Frequency and LoadRatio allow.
+        if now >= due or (now >= demand_due and (is_marked(stale_path) or is_marked(reads_path))):
+            return True
+        elif now >= deadline:
+            return False
+
+        time.sleep(max(0, min(1, due - now, deadline - now)))
+
+def generate_cycle(config, server, cycle, cycle_temp):
+    from qscache.qscache import read_generation, get_privileges_path
+
+    os.mkdir(cycle_temp)
+    start_time = time.time()
+    reads = take_reads(config, server, cycle)
+    cycle_time = timer()
+
+    pbs_args = [config["pbs"]["qstat"], "-t", "-f", "-Fdsv", r"-D\|-"]
+    pbs_time = [config["pbs"]["qstat"], "1", "-f", "-Fjson"]
+
+    if cycle == "history":
+        pbs_args.append("-x")
+
+    views = get_views(config, server) if cycle == "active" else None
+
+    # Parse qstat output through a pipe while it runs instead of after it exits
+    qstat_time = timer()
+
+    with open(f"{cycle_temp}/{cycle}", "wb") as tf:
+        if config["pbs"]["prefix"]:
+            qstat = subprocess.Popen("{} {}".format(config["pbs"]["prefix"], " ".join(pbs_args)), shell = True, stdout = subprocess.PIPE)
+        else:
+            qstat = subprocess.Popen(pbs_args, stdout = subprocess.PIPE)
+
+        with qstat:
+            records, locations, cache, changes = ingest_records(config, server, cycle, qstat.stdout, tf, views)
+
+    # Only time spent in qstat reflects load on the server
+    qstat_time = timer() - qstat_time
+    age_time = timer()
+
+    with open(f"{cycle_temp}/{cycle}.age", "w") as uf:
+        if config["pbs"]["prefix"]:
+            subprocess.run("{} {}".format(config["pbs"]["prefix"], " ".join(pbs_time)), shell = True, stdout = uf, stderr = subprocess.DEVNULL)
+        else:
+            subprocess.run(pbs_time, stdout = uf, stderr = subprocess.DEVNULL)
+
+    qstat_time += timer() - age_time
+    cycle_time = timer() - cycle_time
+    schedule = read_schedule(config, server, cycle)
+    interval = get_cycle_interval(config, cycle, qstat_time, reads, schedule["interval"] if schedule else 0)
+    write_schedule(config, server, cycle, start_time, interval, qstat_time)
+
+    if "log" in config["run"]:
+        timestamp = datetime.now().strftime("%H:%M:%S")
+
+        with open(config["run"]["log"], "a") as lf:
+            lf.write("{:10} cycle={:9} type={:7} {:>10.2f} seconds qstat={:.2f}s reads={} next={:.0f}s\n".format(timestamp,
+                    config["run"]["pid"], cycle, cycle_time, qstat_time, reads, interval))
+
+    artifacts = get_artifacts(config, cycle) + ["dat"]
+    published = read_generation(config, server, cycle)
+    generation = "{}/{}-{}.{}".format(config["paths"]["data"], server, cycle, int(time.time() * 1000))
+    os.mkdir(generation)
+
+    # When nothing changed, the new generation shares the published files
+    if changes or not published or not all(os.path.isfile(f"{published}/{kind}") for kind in artifacts):
+        data_file = f"{cycle_temp}/{cycle}"
+        codec = config[cycle]["compression"]
+
+        if codec in blocks.CODECS:
+            with open(data_file, "rb") as df:
+                lines = [line for line in df if record_key(line)]
+
+            data_file = f"{cycle_temp}/{cycle}.blocks"
+            locations = blocks.write_blocks(data_file, lines, codec, int(config[cycle]["blocksize"]))
+
+        index_cycle_data(records, cache, f"{cycle_temp}/{cycle}.idx", f"{cycle_temp}/{cycle}.sidx", locations, os.path.getsize(data_file))
+
+        write_times(records, cache, f"{cycle_temp}/{cycle}")
+
+        for kind in get_fragment_kinds(config, cycle):
+            write_fragments(records, cache, f"{cycle_temp}/{cycle}", kind, codec, int(config[cycle]["blocksize"]))
+
+        if cycle == "active":
+            render_views(records, cache, views, f"{cycle_temp}/{cycle}")
+        else:
+            write_finished(records, cache, f"{cycle_temp}/{cycle}.fin")
+
+        shutil.move(data_file, f"{cycle_temp}/{cycle}.dat")
+
+        for kind in artifacts:
+            shutil.move(f"{cycle_temp}/{cycle}.{kind}", f"{generation}/{kind}")
+    else:
+        for kind in artifacts:
+            try:
+                os.link(f"{published}/{kind}", f"{generation}/{kind}")
+            except OSError:
+                shutil.copyfile(f"{published}/{kind}", f"{generation}/{kind}")
+
+    shutil.move(f"{cycle_temp}/{cycle}.age", f"{generation}/age")
+    publish_generation(config, server, cycle, generation)
+
+    # Requests for a refresh were about the data just replaced
+    take_reads(config, server, cycle, "stale")
+
+    # Group membership can change without any job changing, so always refresh
+    if cycle == "active" and config["privileges"]["active"] == "True":
+        write_privileges(config, records, f"{cycle_temp}/privileges.map")
+        shutil.move(f"{cycle_temp}/privileges.map", get_privileges_path(config, server))
+
 def run_cache_cycle(config, server, cycle = "active"):
     # Don't run if already running
     host_file = "{}/qscache-host.{}".format(config["paths"]["temp"], cycle)
@@ -56,36 +627,7 @@ def run_cache_cycle(config, server, cycle = "active"):
     with open(pid_file, "w") as pf:
         pf.write(config["run"]["pid"])
 
-    os.mkdir(cycle_temp)
-    cycle_time = timer()
-
-    pbs_args = [config["pbs"]["qstat"], "-t", "-f", "-Fdsv", r"-D\|-"]
-    pbs_time = [config["pbs"]["qstat"], "1", "-f", "-Fjson"]
-
-    if cycle == "history":
-        pbs_args.append("-x")
-
-    with open(f"{cycle_temp}/{cycle}", "w") as tf:
-        if config["pbs"]["prefix"]:
-            subprocess.run("{} {}".format(config["pbs"]["prefix"], " ".join(pbs_args)), shell = True, stdout = tf)
-        else:
-            subprocess.run(pbs_args, stdout = tf)
-
-    with open(f"{cycle_temp}/{cycle}.age", "w") as uf:
-        if config["pbs"]["prefix"]:
-            subprocess.run("{} {}".format(config["pbs"]["prefix"], " ".join(pbs_time)), shell = True, stdout = uf, stderr = subprocess.DEVNULL)
-        else:
-            subprocess.run(pbs_time, stdout = uf, stderr = subprocess.DEVNULL)
-
-    if "log" in config["run"]:
-        timestamp = datetime.now().strftime("%H:%M:%S")
-
-        with open(config["run"]["log"], "a") as lf:
-            cycle_time = timer() - cycle_time
-            lf.write("{:10} cycle={:9} type={:7} {:>10.2f} seconds\n".format(timestamp, config["run"]["pid"], cycle, cycle_time))
-
-    shutil.move(f"{cycle_temp}/{cycle}", "{}/{}-{}.dat".format(config["paths"]["data"], server, cycle))
-    shutil.move(f"{cycle_temp}/{cycle}.age", "{}/{}-{}.age".format(config["paths"]["data"], server, cycle))
+    generate_cycle(config, server, cycle, cycle_temp)
 
     try:
         os.remove(pid_file)
@@ -143,16 +685,11 @@ def main(remote = False, util_path = ""):
             config["run"]["log"] = "{}/PBS-{}-{}.log".format(config["paths"]["logs"], server.upper(),
                     datetime.now().strftime("%Y%m%d"))
 
-        start_time = timer()
-        cycle_freq = int(config[cycle]["frequency"])
+        deadline = time.time() + 60
 
-        while (timer() - start_time) < 60:
+        # Cycles follow the adaptive schedule until the next cron run takes over
+        while wait_for_cycle(config, server, cycle, deadline):
             run_cache_cycle(config, server, cycle)
 
-            if cycle_freq < 60:
-                time.sleep(cycle_freq)
-            else:
-                break
-
 if __name__ == "__main__":
     main()
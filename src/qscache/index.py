@@ -0,0 +1,104 @@
+import mmap
+
+# Cache indexes are sorted text files of fixed-width records:
+#
+#   <key> <offset> <length>
+#
+# The first record is a header of the same width describing the layout and the
+# size of the data file it was built against. Readers bisect the file in place
+# so a lookup costs a handful of page reads regardless of how many jobs exist.
+
+INDEX_VERSION = "1"
+
+# Secondary indexes map "<kind>:<value>:<job id>" to the same records, so a
+# prefix lookup on "<kind>:<value>:" returns every job with that value
+SECONDARY_KEYS = (("owner", b"|-Job_Owner="), ("queue", b"|-queue="), ("state", b"|-job_state="))
+
+def record_key(line):
+    return line[:line.find(b"|-")].split(b" ")[-1]
+
+def field_value(line, field):
+    start = line.find(field)
+
+    if start < 0:
+        return None
+
+    start += len(field)
+    end = line.find(b"|-", start)
+
+    return line[start:end] if end >= 0 else line[start:].rstrip(b"\n")
+
+def secondary_key(kind, value, job_id = ""):
+    return "{}:{}:{}".format(kind, value, job_id)
+
+def write_index(path, entries, data_size):
+    entries = sorted((key.encode(), offset, length) for key, offset, length in entries)
+    key_width = max((len(e[0]) for e in entries), default = 1)
+    offset_width = len(str(max([data_size] + [e[1] for e in entries])))
+    length_width = max((len(str(e[2])) for e in entries), default = 1)
+    row_width = key_width + offset_width + length_width + 3
+
+    header = "qsindex {} {} {} {} {}".format(INDEX_VERSION, len(entries), data_size, key_width, offset_width)
+
+    if len(header) >= row_width:
+        length_width += len(header) - row_width + 1
+        row_width = len(header) + 1
+
+    with open(path, "wb") as index_file:
+        index_file.write("{:{}}\n".format(header, row_width - 1).encode())
+
+        for key, offset, length in entries:
+            index_file.write(b"%-*s %*d %*d\n" % (key_width, key, offset_width, offset, length_width, length))
+
+def open_index(path, data_size):
+    try:
+        with open(path, "rb") as index_file:
+            header = index_file.readline()
+            fields = header.split()
+
+            if fields[0] != b"qsindex" or fields[1].decode() != INDEX_VERSION or int(fields[3]) != data_size:
+                return None
+
+            return mmap.mmap(index_file.fileno(), 0, access = mmap.ACCESS_READ), len(header), int(fields[2]), int(fields[4])
+    except (OSError, ValueError, IndexError):
+        return None
+
+def search_index(index, prefixes):
+    mm, row_width, count, key_width = index
+    locations = set()
+
+    for prefix in prefixes:
+        prefix = prefix.encode()
+        low, high = 1, count + 1
+
+        while low < high:
+            mid = (low + high) // 2
+
+            if mm[mid * row_width:mid * row_width + key_width].rstrip() < prefix:
+                low = mid + 1
+            else:
+                high = mid
+
+        # Matches are contiguous, so array subjobs follow their parent
+        while low <= count:
+            row = mm[low * row_width:(low + 1) * row_width].split()
+
+            if not row[0].startswith(prefix):
+                break
+
+            locations.add((int(row[1]), int(row[2]), row[0]))
+            low += 1
+
+    return sorted(locations)
+
+def find_records(path, prefixes, data_size):
+    index = open_index(path, data_size)
+
+    if index is None:
+        return None
+
+    with index[0]:
+        try:
+            return search_index(index, prefixes)
+        except (ValueError, IndexError):
+            return None
@@ -1,12 +1,14 @@
 #!/usr/bin/env python3
 
-import os, sys, re, json, collections, time, subprocess, grp
-import configparser, socket, argparse, getpass, textwrap
+import os, sys, re, json, collections, time, grp, marshal
+import argparse, getpass, functools, string
 
 from signal import signal, SIGPIPE, SIG_DFL
 from datetime import datetime
 from timeit import default_timer as timer
 
+from qscache import index, blocks
+
 
 help_text = """This command provides a lightweight alternative to qstat. Data
 are queried and updated every minute from the PBS job scheduler. Options not
@@ -28,6 +30,27 @@ The default format string for default mode output is:
 
 DT_NOW=datetime.now()
 
+# Parsed snapshots held in memory when running inside the query daemon
+snapshots = {}
+
+# Published generation each server and source resolved to, so that a run reads
+# every file from the same snapshot
+generations = {}
+
+# Servers and sources this run already warned about and asked to refresh
+refresh_requests = set()
+
+# Per-phase timing for this invocation, when profiling is enabled
+profile = None
+
+# Functions timed by the profiler, with the phase and count each one feeds
+PROFILE_PHASES = { "get_server_info"    : ("age", None),
+                   "find_indexed_jobs"  : ("index", None),
+                   "parse_job"          : ("parse", "scanned"),
+                   "check_job"          : ("filter", "matched"),
+                   "print_job"          : ("render", None),
+                   "print_view"         : ("render", None) }
+
 class altair_string(collections.UserString):
     def __init__(self, value, suffix = "*"):
         self.value = str(value)
@@ -57,35 +80,6 @@ class altair_dict(collections.UserDict):
                 dictionary[key] = altair_dict(value, **kwargs)
             elif key == "comment":
                 dictionary[key] = altair_string(value, suffix = "...")
-            elif key == "start_time" and "process_start" in kwargs:
-                start_time = datetime.strptime(value, "%c")
-                elapsed_secs = start_time.timestamp() - DT_NOW.timestamp()
-
-                if kwargs["process_start"] == "default":
-                    if elapsed_secs <= 0:
-                        dictionary[key] = altair_string("--")
-                    elif start_time.day == DT_NOW.day:
-                        dictionary[key] = altair_string(start_time.strftime("%H:%M"))
-                    elif (start_time.day - DT_NOW.day) < 7:
-                        tmp_str = start_time.strftime("%a%H")
-                        dictionary[key] = altair_string(tmp_str[:2] + " " + tmp_str[3:])
-                    elif start_time.year == DT_NOW.year:
-                        dictionary[key] = altair_string(start_time.strftime("%b"))
-                    elif elapsed_secs <= 157680000:
-                        dictionary[key] = altair_string(start_time.strftime("%Y"))
-                    else:
-                        dictionary[key] = altair_string(">5yrs")
-                else:
-                    if elapsed_secs <= 0:
-                        dictionary[key] = altair_string("--")
-                    elif start_time.day == DT_NOW.day:
-                        dictionary[key] = altair_string("Today " + start_time.strftime("%H:%M"))
-                    elif (start_time.day - DT_NOW.day) < 7:
-                        dictionary[key] = altair_string(start_time.strftime("%a %H:%M"))
-                    elif start_time.year == DT_NOW.year:
-                        dictionary[key] = altair_string(start_time.strftime("%a %b %d %H:%M"))
-                    else:
-                        dictionary[key] = altair_string(value)
             elif key != "walltime":
                 dictionary[key] = altair_string(value)
 
@@ -104,22 +98,289 @@ class altair_dict(collections.UserDict):
         else:
             return self.fill_value
 
-def log_usage(config, used_cache, info = ""):
-    if "log" in config["run"]:
+class output_buffer:
+    def __init__(self, stream = None, limit = 1 << 18):
+        self.stream = stream
+        self.chunks = []
+        self.size = 0
+        self.limit = limit
+
+    def write(self, text):
+        self.chunks.append(text)
+        self.size += len(text)
+
+        if self.size >= self.limit:
+            self.flush()
+
+    def writeline(self, text = ""):
+        self.write(text + "\n")
+
+    def flush(self):
+        # With SIGPIPE at its default, a closed reader ends us quietly here
+        stream = self.stream or sys.stdout
+
+        if self.chunks:
+            stream.write("".join(self.chunks))
+            self.chunks, self.size = [], 0
+
+        stream.flush()
+
+output = output_buffer()
+
+# Document writer for -F json output and pre-rendered -f blocks, set up by main
+json_output = None
+full_blocks = None
+
+# Epoch values of job time fields for -T listings, set up by main
+job_times = None
+
+# Labels for each calendar day a start time falls on, relative to DT_NOW
+start_days = {}
+
+def get_start_day(local_time):
+    key = (DT_NOW.year, DT_NOW.day) + tuple(local_time[:3])
+
+    if key not in start_days:
+        if local_time.tm_mday == DT_NOW.day:
+            bucket = "today"
+        elif (local_time.tm_mday - DT_NOW.day) < 7:
+            bucket = "week"
+        elif local_time.tm_year == DT_NOW.year:
+            bucket = "year"
+        else:
+            bucket = "later"
+
+        start_days[key] = (bucket, time.strftime("%a", local_time), time.strftime("%b", local_time))
+
+    return start_days[key]
+
+def format_start_time(value, mode, epoch = None):
+    if epoch is None:
+        epoch = datetime.strptime(value, "%c").timestamp()
+
+    elapsed_secs = epoch - DT_NOW.timestamp()
+
+    if elapsed_secs <= 0:
+        return "--"
+
+    local_time = time.localtime(epoch)
+    bucket, weekday, month = get_start_day(local_time)
+    clock = "{:02d}:{:02d}".format(local_time.tm_hour, local_time.tm_min)
+
+    if mode == "default":
+        if bucket == "today":
+            return clock
+        elif bucket == "week":
+            tmp_str = weekday + clock[:2]
+            return tmp_str[:2] + " " + tmp_str[3:]
+        elif bucket == "year":
+            return month
+        elif elapsed_secs <= 157680000:
+            return str(local_time.tm_year)
+        else:
+            return ">5yrs"
+    else:
+        if bucket == "today":
+            return "Today " + clock
+        elif bucket == "week":
+            return weekday + " " + clock
+        elif bucket == "year":
+            return "{} {} {:02d} {}".format(weekday, month, local_time.tm_mday, clock)
+        else:
+            return value
+
+class phase_timer:
+    def __init__(self, wall = None, cpu = None):
+        self.wall = wall or timer()
+        self.cpu = cpu or time.process_time()
+        self.phases = {}
+        self.counts = { "scanned" : 0, "matched" : 0 }
+
+    def add(self, phase, wall, cpu):
+        totals = self.phases.setdefault(phase, [0, 0])
+        totals[0] += wall
+        totals[1] += cpu
+
+    def wrap(self, phase, func, count = None):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            wall, cpu = timer(), time.process_time()
+            result = func(*args, **kwargs)
+            self.add(phase, timer() - wall, time.process_time() - cpu)
+
+            if count and result:
+                self.counts[count] += 1
+
+            return result
+
+        return timed
+
+    def fields(self):
+        phases = dict(self.phases, total = [timer() - self.wall, time.process_time() - self.cpu])
+        return { phase : [round(wall * 1000, 2), round(cpu * 1000, 2)] for phase, (wall, cpu) in phases.items() }
+
+    def summary(self):
+        fields = ["{}={:.2f}/{:.2f}".format(phase, wall, cpu) for phase, (wall, cpu) in self.fields().items()]
+        return " ".join(fields + ["{}={}".format(key, value) for key, value in self.counts.items()])
+
+def log_usage(config, used_cache, reason = None):
+    info = f"reason={reason}" if reason else ""
+
+    if profile:
+        info = "{} {}".format(info, profile.summary()).strip()
+
+        if "QSCACHE_PROFILE" in os.environ and "log" not in config["run"]:
+            print("Profile (wall/cpu ms): {}".format(info), file = sys.stderr)
+
+    if "log" not in config["run"]:
+        return
+
+    if config["paths"]["logformat"] == "jsonl":
+        record = { "time"   : round(time.time(), 3),
+                   "host"   : config["run"]["host"],
+                   "pid"    : int(config["run"]["pid"]),
+                   "user"   : config["run"]["user"],
+                   "cache"  : used_cache,
+                   "args"   : sys.argv[1:] }
+
+        if reason:
+            record["reason"] = reason
+
+        if profile:
+            record["profile"] = profile.fields()
+            record.update(profile.counts)
+
+        # One append per call to a per-host file that every user shares; small
+        # writes land whole. A failed log must never fail the query itself.
+        try:
+            fd = os.open(config["run"]["log"], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        except OSError:
+            return
+
+        try:
+            if os.fstat(fd).st_uid == os.getuid():
+                os.fchmod(fd, 0o666)
+
+            os.write(fd, (json.dumps(record, separators = (",", ":")) + "\n").encode())
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+    else:
         timestamp = DT_NOW.strftime("%H:%M:%S")
 
-        with open(config["run"]["log"], "a") as lf:
-            lf.write("{:10} {:20} {:10} {:10} {:15} {}\n".format(timestamp, config["run"]["host"],
-                    config["run"]["pid"], f"cache={used_cache}", info, " ".join(sys.argv[1:])))
+        try:
+            with open(config["run"]["log"], "a") as lf:
+                lf.write("{:10} {:20} {:10} {:10} {:15} {}\n".format(timestamp, config["run"]["host"],
+                        config["run"]["pid"], f"cache={used_cache}", info, " ".join(sys.argv[1:])))
+        except OSError:
+            pass
+
+# Bypasses caused by unhealthy cache data, which many clients hit at once
+COALESCE_REASONS = ("nodata", "olddata", "metadata")
+
+def read_shared_result(path, max_age):
+    try:
+        fd = os.open(f"{path}.out", os.O_RDONLY | os.O_NOFOLLOW)
+    except OSError:
+        return None
+
+    with open(fd, "rb") as rf:
+        status = os.fstat(rf.fileno())
+
+        if status.st_uid != os.getuid() or time.time() - status.st_mtime > max_age:
+            return None
+
+        try:
+            return marshal.load(rf)
+        except (EOFError, ValueError, TypeError):
+            return None
+
+def remove_shared_results(config, max_age):
+    import fcntl, glob
+
+    # Results are only reused for max_age, so each leader sweeps away older ones
+    for lock_path in glob.glob("{}/qscache-{}-*.lock".format(config["paths"]["coalesce"], os.getuid())):
+        path = lock_path[:-5]
+
+        try:
+            last_used = max(os.lstat(f"{path}.{kind}").st_mtime for kind in ("lock", "out") if os.path.lexists(f"{path}.{kind}"))
+
+            if time.time() - last_used <= max_age:
+                continue
+
+            fd = os.open(lock_path, os.O_RDWR | os.O_NOFOLLOW)
+        except (OSError, ValueError):
+            continue
+
+        # A lock someone holds still has a query running behind it
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+            for kind in ("out", "lock"):
+                try:
+                    os.remove(f"{path}.{kind}")
+                except FileNotFoundError:
+                    pass
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+def run_shared_query(config, args, delay):
+    import fcntl, hashlib, subprocess
+
+    # Identical bypassed queries from one user share a single real qstat call,
+    # reused for as long as a cache cycle would have been
+    path = "{}/qscache-{}-{}".format(config["paths"]["coalesce"], os.getuid(), hashlib.sha1("\0".join(args).encode()).hexdigest()[:16])
+    deadline = timer() + int(config["cache"]["maxwait"])
+
+    try:
+        fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+    except OSError:
+        return None
+
+    try:
+        if os.fstat(fd).st_uid != os.getuid():
+            return None
+
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                if timer() > deadline:
+                    return None
+
+                time.sleep(0.05)
+
+        result = read_shared_result(path, int(config["cache"]["frequency"]))
+
+        if result is None:
+            time.sleep(int(delay))
+            proc = subprocess.run(args, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+            result = { "status" : proc.returncode, "stdout" : proc.stdout, "stderr" : proc.stderr }
+
+            try:
+                with open(os.open(f"{path}.{os.getpid()}", os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb") as rf:
+                    marshal.dump(result, rf)
+
+                os.replace(f"{path}.{os.getpid()}", f"{path}.out")
+            except OSError:
+                pass
+
+            remove_shared_results(config, int(config["cache"]["frequency"]))
+
+        return result
+    finally:
+        os.close(fd)
 
 def bypass_cache(config, reason, delay = 1):
     if not os.path.isfile(config["pbs"]["qstat"]):
         print("Error: PBS cannot be found on this system", file = sys.stderr)
         sys.exit(1)
 
-    time.sleep(int(delay))
-    log_usage(config, "no", "reason={}".format(reason))
-
+    output.flush()
     args = [config["pbs"]["qstat"]]
     skip_next = False
 
@@ -130,46 +391,108 @@ def bypass_cache(config, reason, delay = 1):
             args.append(arg)
             skip_next = False
 
+    if reason in COALESCE_REASONS and config["paths"]["coalesce"]:
+        result = run_shared_query(config, args, delay)
+
+        if result is not None:
+            log_usage(config, "no", reason)
+            sys.stdout.flush()
+            sys.stdout.buffer.write(result["stdout"])
+            sys.stdout.flush()
+            sys.stderr.buffer.write(result["stderr"])
+            sys.stderr.flush()
+            sys.exit(result["status"])
+
+    time.sleep(int(delay))
+    log_usage(config, "no", reason)
+
+    import subprocess
     proc = subprocess.run(args)
     sys.exit(proc.returncode)
 
+def get_config_defaults(pkg_root, server):
+    return {
+        "paths"                 : {
+                "install_dir"   : pkg_root,
+                "data"          : f"{pkg_root}/data/{server}",
+                "temp"          : f"{pkg_root}/temp/{server}",
+                "logs"          : "",
+                "logformat"     : "jsonl",
+                "coalesce"      : "/tmp"
+                },
+        "cache"                 : {
+                "maxwait"       : "20",
+                "maxage"        : "300",
+                "expireage"     : "${maxage}",
+                "agedelay"      : "5",
+                "frequency"     : "60",
+                "idlefrequency" : "240",
+                "loadratio"     : "10",
+                "profile"       : "False",
+                "compression"   : "none",
+                "blocksize"     : "262144",
+                "prerender"     : ""
+                },
+        "history"               : {
+                "maxage"        : "600",
+                "expireage"     : "${maxage}",
+                "frequency"     : "60",
+                "idlefrequency" : "480",
+                "loadratio"     : "10",
+                "compression"   : "zlib",
+                "blocksize"     : "262144",
+                "prerender"     : ""
+                },
+        "pbs"                   : {
+                "qstat"         : "/opt/pbs/bin/qstat"
+                },
+        "privileges"            : {
+                "active"        : "False"
+                },
+        "daemon"                : {
+                "socket"        : "",
+                "sources"       : "active history"
+                },
+        "priv.all"              : {
+                "users"         : "",
+                "groups"        : ""
+                },
+        "priv.env"              : {
+                "users"         : "",
+                "groups"        : ""
+                }
+        }
+
 def read_config(path, pkg_root, server = "site"):
+    run = { "pid" : str(os.getpid()), "host" : os.uname().nodename }
+    snapshot_path = f"{path}.snapshot"
+    defaults = get_config_defaults(pkg_root, server)
+
+    # Parsed settings are kept in a snapshot that is valid while everything they
+    # were parsed from matches: the file, the defaults, and this code
+    try:
+        code_stat = os.stat(__file__)
+
+        with open(path, "rb") as config_file:
+            snapshot_key = [config_file.read(), defaults, code_stat.st_mtime_ns, code_stat.st_size]
+    except OSError:
+        snapshot_key = None
+
+    try:
+        with open(snapshot_path, "rb") as sf:
+            snapshot = marshal.load(sf)
+
+        if snapshot_key and snapshot["key"] == snapshot_key:
+            config = snapshot["config"]
+            config["run"], config["active"] = run, config["cache"]
+            return config
+    except (OSError, EOFError, ValueError, TypeError, KeyError):
+        pass
+
+    import configparser
+
     config = configparser.ConfigParser(interpolation = configparser.ExtendedInterpolation())
-    config.read_dict({
-            "paths"                 : {
-                    "install_dir"   : pkg_root,
-                    "data"          : f"{pkg_root}/data/{server}",
-                    "temp"          : f"{pkg_root}/temp/{server}",
-                    "logs"          : ""
-                    },
-            "cache"                 : {
-                    "maxwait"       : "20",
-                    "maxage"        : "300",
-                    "agedelay"      : "5",
-                    "frequency"     : "60"
-                    },
-            "history"               : {
-                    "maxage"        : "600"
-                    },
-            "pbs"                   : {
-                    "qstat"         : "/opt/pbs/bin/qstat"
-                    },
-            "privileges"            : {
-                    "active"        : "False"
-                    },
-            "priv.all"              : {
-                    "users"         : "",
-                    "groups"        : ""
-                    },
-            "priv.env"              : {
-                    "users"         : "",
-                    "groups"        : ""
-                    },
-            "run"                   : {
-                    "pid"           : str(os.getpid()),
-                    "host"          : socket.gethostname()
-                    }
-            })
+    config.read_dict(dict(defaults, run = run))
 
     try:
         with open(path, "r") as config_file:
@@ -178,8 +501,23 @@ def read_config(path, pkg_root, server = "site"):
         print("No site config found for cached qstat. Bypassing cache...\n", file = sys.stderr)
         bypass_cache(config, "nocfg")
 
+    config = {name : dict(config[name]) for name in config.sections() if name != "run"}
+
+    # Readers that cannot write here simply parse the file each time
+    if snapshot_key:
+        try:
+            # Hosts may share this directory, so the temporary name needs both
+            temp_path = "{}.{}.{}".format(snapshot_path, run["host"], run["pid"])
+
+            with open(temp_path, "wb") as sf:
+                marshal.dump({ "key" : snapshot_key, "config" : config }, sf)
+
+            os.replace(temp_path, snapshot_path)
+        except OSError:
+            pass
+
     # Duplicate "cache" settings as "active" for easy retrieval
-    config["active"] = config["cache"]
+    config["run"], config["active"] = run, config["cache"]
 
     return config
 
@@ -190,96 +528,294 @@ def get_mapped_server(config, server, request = "key"):
         return [s for s in config["servermap"] if config["servermap"][s] == server][0], server
 
 def get_server_info(config, server, source):
-    if source == "active":
-        max_age = config["cache"]["maxage"]
-    else:
-        max_age = config[source]["maxage"]
-
-    age_path = "{}/{}-{}.age".format(config["paths"]["data"], server, source)
-    start_time = timer()
+    max_age, expire_age = config[source]["maxage"], config[source]["expireage"]
 
-    while True:
+    if (server, source) in snapshots:
+        server_info = snapshots[server, source].server_info
+    else:
         try:
-            with open(age_path, "r") as uf:
-                try:
-                    server_info = json.load(uf)
-                    break
-                except json.decoder.JSONDecodeError:
-                    if (timer() - start_time) > int(config["cache"]["maxwait"]):
-                        print("No data found at configured path. Bypassing cache...\n", file = sys.stderr)
-                        bypass_cache(config, "nodata")
-                    time.sleep(1)
-        except FileNotFoundError:
+            with open(get_snapshot_path(config, server, source, "age"), "r") as uf:
+                server_info = json.load(uf)
+        except OSError:
             print("Empty cache found for cached qstat. Bypassing cache...\n", file = sys.stderr)
             bypass_cache(config, "nodata")
+        except ValueError:
+            print("{} cache has metadata errors. Bypassing cache...\n".format(source), file = sys.stderr)
+            bypass_cache(config, "metadata", config["cache"]["agedelay"])
 
     try:
-        if (int(time.time()) - int(server_info["timestamp"])) >= int(max_age) and "QSCACHE_IGNORE_AGE" not in os.environ:
-            print("{} data is more than {} seconds old. Bypassing cache...\n".format(source, max_age), file = sys.stderr)
-            bypass_cache(config, "olddata", config["cache"]["agedelay"])
-        else:
+        age = int(time.time()) - int(server_info["timestamp"])
+
+        if age < int(max_age) or "QSCACHE_IGNORE_AGE" in os.environ:
             return server_info
+        elif age < int(expire_age):
+            # Past MaxAge but not expired: serve it and ask gen_data to hurry
+            if (server, source) not in refresh_requests:
+                print("{} data is more than {} seconds old. Using cache until refreshed...\n".format(source, max_age), file = sys.stderr)
+                request_refresh(config, server, source)
+                refresh_requests.add((server, source))
+
+            return server_info
+        else:
+            print("{} data is more than {} seconds old. Bypassing cache...\n".format(source, expire_age), file = sys.stderr)
+            bypass_cache(config, "olddata", config["cache"]["agedelay"])
     except ValueError:
             print("{} cache has metadata errors. Bypassing cache...\n".format(source), file = sys.stderr)
             bypass_cache(config, "metadata", config["cache"]["agedelay"])
 
-def get_job_data(config, server, source, process_env = False, select_ids = None):
-    get_server_info(config, server, source)
-    data_path = "{}/{}-{}.dat".format(config["paths"]["data"], server, source)
-    start_time = timer()
+def get_data_path(config, server, source, kind):
+    return "{}/{}-{}.{}".format(config["paths"]["data"], server, source, kind)
+
+def read_generation(config, server, source):
+    # gen_data switches this link only once a generation is complete
+    try:
+        return "{}/{}".format(config["paths"]["data"], os.readlink(get_data_path(config, server, source, "current")))
+    except OSError:
+        return None
+
+def get_snapshot_path(config, server, source, kind):
+    if (server, source) not in generations:
+        generations[server, source] = read_generation(config, server, source)
 
-    while True:
-        with open(data_path, "r", errors = "ignore") as data_file:
+    return "{}/{}".format(generations[server, source], kind)
+
+def record_read(config, server, source, kind = "reads"):
+    # gen_data sizes this file to see whether anyone is reading its data
+    try:
+        fd = os.open(get_data_path(config, server, source, kind), os.O_WRONLY | os.O_APPEND)
+    except OSError:
+        return
+
+    try:
+        os.write(fd, b".")
+    finally:
+        os.close(fd)
+
+def request_refresh(config, server, source):
+    # Any bytes here make gen_data start its next cycle once Frequency allows
+    record_read(config, server, source, "stale")
+
+def get_projection(fields):
+    keys = {"Job_Owner", "job_state", "queue", "server", "exec_host", "comment"}
+
+    for main_key, sub_key in re.findall(r"{([^}\[:!]*)(?:\[([^\]]*)\])?", fields):
+        if sub_key:
+            keys.add(f"{main_key}.{sub_key}")
+        elif main_key != "Job_Id":
+            keys.add(main_key)
+
+    return [(f"|-{key}=",) + tuple(key.split(".", 1)) for key in sorted(keys)]
+
+def parse_job_fields(line, projection):
+    job_info = {}
+
+    # Pull only the projected fields out of the record, leaving the rest undecoded
+    for field, *keys in projection:
+        start = line.find(field)
+
+        if start < 0:
+            continue
+
+        start += len(field)
+        end = line.find("|-", start)
+        value = line[start:end] if end >= 0 else line[start:].rstrip("\n")
+
+        if len(keys) > 1:
             try:
-                for line in data_file:
-                    data = line.rstrip("\n").split("|-")
-                    job_id = data[0].split(" ")[-1]
-
-                    # Let's not do anything else if not a requested ID
-                    if select_ids:
-                        if not any(job_id.startswith(sid) for sid in select_ids):
-                            continue
-
-                    job_info = {}
-
-                    for item in data[1:]:
-                        key, value = item.split("=", maxsplit = 1)
-
-                        if "." in key:
-                            main_key, sub_key = key.split(".")
-
-                            try:
-                                job_info[main_key][sub_key] = value
-                            except KeyError:
-                                job_info[main_key] = {sub_key : value}
-                        elif process_env and key == "Variable_List":
-                            job_info[key] = {}
-                            use_re = False
-
-                            # Try to avoid using lookback-expression, as it is expensive!
-                            for env_var in value.split(","):
-                                try:
-                                    ek, ev = env_var.split("=", maxsplit = 1)
-                                    job_info[key][ek] = ev
-                                except ValueError:
-                                    use_re = True
-                                    break
-
-                            if use_re:
-                                for env_var in re.split(r"(?<!\\),", value):
-                                    ek, ev = env_var.split("=", maxsplit = 1)
-                                    job_info[key][ek] = ev
-                        else:
-                            job_info[key] = value
-
-                    yield job_id, job_info
+                job_info[keys[0]][keys[1]] = value
+            except KeyError:
+                job_info[keys[0]] = {keys[1] : value}
+        else:
+            job_info[keys[0]] = value
 
-                break
-            except FileNotFoundError:
-                if (timer() - start_time) > int(config["cache"]["maxwait"]):
-                    print("No data found at configured path. Bypassing cache...\n", file = sys.stderr)
-                    bypass_cache(config, "nodata")
-                time.sleep(1)
+    return job_info
+
+def parse_job(line, process_env = False, projection = None):
+    if projection:
+        return parse_job_fields(line, projection)
+
+    data = line.rstrip("\n").split("|-")
+    job_info = {}
+
+    for item in data[1:]:
+        key, value = item.split("=", maxsplit = 1)
+
+        if "." in key:
+            main_key, sub_key = key.split(".")
+
+            try:
+                job_info[main_key][sub_key] = value
+            except KeyError:
+                job_info[main_key] = {sub_key : value}
+        elif process_env and key == "Variable_List":
+            job_info[key] = {}
+            use_re = False
+
+            # Try to avoid using lookback-expression, as it is expensive!
+            for env_var in value.split(","):
+                try:
+                    ek, ev = env_var.split("=", maxsplit = 1)
+                    job_info[key][ek] = ev
+                except ValueError:
+                    use_re = True
+                    break
+
+            if use_re:
+                for env_var in re.split(r"(?<!\\),", value):
+                    ek, ev = env_var.split("=", maxsplit = 1)
+                    job_info[key][ek] = ev
+        else:
+            job_info[key] = value
+
+    return job_info
+
+def find_indexed_jobs(config, server, source, data_size, select_ids = None, select_keys = None):
+    if select_ids:
+        return index.find_records(get_snapshot_path(config, server, source, "idx"), select_ids, data_size)
+
+    # Each group of keys is a union; jobs must match every group
+    matches = None
+
+    for key_group in select_keys:
+        found = index.find_records(get_snapshot_path(config, server, source, "sidx"), key_group, data_size)
+
+        if found is None:
+            return None
+
+        found = {(offset, length, key.rsplit(b":", 1)[-1]) for offset, length, key in found}
+        matches = found if matches is None else matches & found
+
+    return sorted(matches)
+
+def read_locations(data_file, locations, compressed):
+    if compressed:
+        return list(blocks.read_records(data_file.buffer, [(offset, length) for offset, length, _ in locations]))
+
+    records = []
+
+    for offset, length, _ in locations:
+        data_file.buffer.seek(offset)
+        records.append(data_file.buffer.read(length))
+
+    return records
+
+def read_indexed_jobs(data_file, locations, compressed = False, index_path = None, data_size = None):
+    records = read_locations(data_file, locations, compressed)
+    parents, lines = {}, []
+
+    for line, (_, _, job_id) in zip(records, locations):
+        # Index belongs to another snapshot; caller will scan instead
+        if index.record_key(line) != job_id:
+            return None
+
+        if not blocks.is_packed(line):
+            parents[job_id] = line
+
+    # Packed subjobs need their parent, which need not have matched itself
+    missing = {blocks.get_parent_id(job_id) for line, (_, _, job_id) in zip(records, locations) if blocks.is_packed(line)}
+    missing -= set(parents)
+
+    if missing:
+        found = index.find_records(index_path, [job_id.decode(errors = "ignore") for job_id in missing], data_size)
+
+        if found is None:
+            return None
+
+        found = [location for location in found if location[2] in missing]
+        parents.update((job_id, line) for line, (_, _, job_id) in zip(read_locations(data_file, found, compressed), found))
+
+    for line, (_, _, job_id) in zip(records, locations):
+        if blocks.is_packed(line):
+            try:
+                line = blocks.unpack_subjob(line, parents[blocks.get_parent_id(job_id)].rstrip(b"\n").split(b"|-"))
+            except KeyError:
+                return None
+
+        lines.append(line.decode(data_file.encoding, errors = "ignore"))
+
+    return lines
+
+def get_id_matcher(select_ids):
+    # A job matches an ID it starts with, so hash its prefixes at each ID length
+    select_ids = set(select_ids)
+    lengths = sorted({len(sid) for sid in select_ids})
+
+    def match_id(job_id):
+        return any(job_id[:length] in select_ids for length in lengths)
+
+    return match_id
+
+def get_finished_jobs(config, server, select_ids):
+    get_server_info(config, server, "history")
+
+    if (server, "history") not in snapshots:
+        locations = index.find_records(get_snapshot_path(config, server, "history", "fin"), select_ids, 0)
+
+        # Finished keys carry just what check_job needs, in history order
+        if locations is not None:
+            for _, _, key in locations:
+                job_id, state, owner = key.decode(errors = "ignore").split(":", 2)
+                yield job_id, { "job_state" : state, "Job_Owner" : owner }
+
+            return
+
+    yield from get_job_data(config, server, "history", select_ids = select_ids, projection = get_projection(""))
+
+def get_job_data(config, server, source, process_env = False, select_ids = None, select_keys = None, projection = None, subjobs = True):
+    get_server_info(config, server, source)
+
+    if (server, source) in snapshots:
+        yield from snapshots[server, source].get_jobs(process_env, select_ids, select_keys, subjobs)
+        return
+
+    try:
+        data_file = open(get_snapshot_path(config, server, source, "dat"), "r", errors = "ignore")
+    except OSError:
+        print("No data found at configured path. Bypassing cache...\n", file = sys.stderr)
+        bypass_cache(config, "nodata")
+
+    with data_file:
+        lines = None
+        compressed = blocks.get_codec(data_file.buffer) is not None
+
+        if select_ids or select_keys:
+            data_size = os.fstat(data_file.fileno()).st_size
+            locations = find_indexed_jobs(config, server, source, data_size, select_ids, select_keys)
+
+            if locations is not None:
+                lines = read_indexed_jobs(data_file, locations, compressed, get_snapshot_path(config, server, source, "idx"), data_size)
+
+        if lines is None and compressed:
+            lines = blocks.expand_records((line.decode(data_file.encoding, errors = "ignore") for line in blocks.read_lines(data_file.buffer)), subjobs)
+        elif lines is None:
+            data_file.seek(0)
+            lines = blocks.expand_records(data_file, subjobs)
+
+        if select_ids:
+            match_id = get_id_matcher(select_ids)
+
+        for line in lines:
+            job_id = line[:line.find("|-")].split(" ")[-1]
+
+            # Let's not do anything else if not a requested ID
+            if select_ids and not match_id(job_id):
+                continue
+
+            yield job_id, parse_job(line, process_env, projection)
+
+def get_select_keys(filters, queue = None):
+    select_keys = []
+
+    if filters.u:
+        select_keys.append([index.secondary_key("owner", filters.u)])
+
+    if queue:
+        select_keys.append([index.secondary_key("queue", queue)])
+
+    if filters.status:
+        select_keys.append([index.secondary_key("state", state) for state in set(filters.status)])
+
+    return select_keys
 
 def check_job(job_id, job_info, select_queue = None, filters = None, subjobs = []):
     if select_queue:
@@ -299,52 +835,55 @@ def check_job(job_id, job_info, select_queue = None, filters = None, subjobs = [
         return False
 
     if filters.t:
-        if filters.J and not re.search(r"\[[0-9]+\]", job_id):
+        if filters.J and not blocks.is_subjob(job_id):
             return False
-    elif job_id not in subjobs and re.search(r"\[[0-9]+\]", job_id):
+    elif job_id not in subjobs and blocks.is_subjob(job_id):
         return False
 
     return True
 
-def process_jobs(config, data_server, source, header, limit_user, args, ids, subjobs, process_env, status):
+def process_jobs(config, data_server, source, header, limit_user, args, ids, subjobs, process_env, status, projection = None):
     jobs_found = False
 
     if ids:
         jobs = {job_id : None for job_id in ids}
+        missing = set(ids)
+        subjobs = set(subjobs)
 
-        for job_id, job_info in get_job_data(config, data_server, source, process_env, ids):
+        for job_id, job_info in get_job_data(config, data_server, source, process_env, ids, projection = projection,
+                subjobs = args.t or bool(subjobs)):
             if check_job(job_id, job_info, filters = args, subjobs = subjobs):
                 jobs[job_id] = job_info
+                missing.discard(job_id)
 
                 # Short-circuit job iterator if we have found them all
-                jobs_found = all(v != None for v in jobs.values())
-
-                if jobs_found:
+                if not missing:
                     break
 
         # We need to let the user know if the job is in history, as the real PBS does
-        if source == "active" and not jobs_found:
-            missing_ids = [job_id for job_id in ids if not jobs[job_id]]
+        if source == "active" and missing:
+            record_read(config, data_server, "history")
 
-            for job_id, job_info in get_job_data(config, data_server, "history", process_env, missing_ids):
+            for job_id, job_info in get_finished_jobs(config, data_server, [job_id for job_id in ids if job_id in missing]):
                 if check_job(job_id, job_info, filters = args, subjobs = subjobs):
                     jobs[job_id] = "history"
+                    missing.discard(job_id)
 
                     # Short-circuit job iterator if we have found them all
-                    jobs_found = all(v != None for v in jobs.values())
-
-                    if jobs_found:
+                    if not missing:
                         break
 
+        jobs_found = not missing
+
         try:
             for job_id in jobs:
                 if jobs[job_id] == "history":
-                    print(f"qstat: {job_id} Job has finished, use -x or -H to obtain historical job information")
+                    output.writeline(f"qstat: {job_id} Job has finished, use -x or -H to obtain historical job information")
                 elif jobs[job_id]:
                     print_job(job_id, jobs[job_id], args, header, limit_user)
                     header = False
                 else:
-                    print(f"qstat: Unknown Job Id {job_id}")
+                    output.writeline(f"qstat: Unknown Job Id {job_id}")
         except KeyError:
             pass
 
@@ -357,42 +896,86 @@ def process_jobs(config, data_server, source, header, limit_user, args, ids, sub
 
     return status
 
-def check_privilege(config, user):
-    my_groups = [g.gr_name for g in grp.getgrall() if user in g.gr_mem]
+def get_privilege_settings(config):
+    return [config[f"priv.{level}"][kind] for level in ["all", "env"] for kind in ["users", "groups"]]
 
-    if config["privileges"]["active"] == "True":
-        privilege = "default"
+def get_user_groups(user):
+    import pwd
 
-        for level in ["all", "env"]:
-            if config[f"priv.{level}"]["users"] == "*" or config[f"priv.{level}"]["groups"] == "*":
-                privilege = level
-            elif user in config[f"priv.{level}"]["users"].split():
-                privilege = level
-            elif any((g for g in config[f"priv.{level}"]["groups"].split() if g in my_groups)):
-                privilege = level
-    else:
-        privilege = "env"
+    try:
+        group_ids = os.getgrouplist(user, pwd.getpwnam(user).pw_gid)
+    except KeyError:
+        return []
+
+    my_groups = []
+
+    for gid in group_ids:
+        try:
+            my_groups.append(grp.getgrgid(gid).gr_name)
+        except KeyError:
+            pass
+
+    return my_groups
+
+def get_privilege_level(config, user, my_groups):
+    privilege = "default"
+
+    for level in ["all", "env"]:
+        if config[f"priv.{level}"]["users"] == "*" or config[f"priv.{level}"]["groups"] == "*":
+            privilege = level
+        elif user in config[f"priv.{level}"]["users"].split():
+            privilege = level
+        elif any((g for g in config[f"priv.{level}"]["groups"].split() if g in my_groups)):
+            privilege = level
 
     return privilege
 
+def get_privileges_path(config, server):
+    # Servers may share a data path, and each table only covers its own job owners
+    return "{}/{}-privileges.map".format(config["paths"]["data"], server)
+
+def check_privilege(config, server, user):
+    if config["privileges"]["active"] != "True":
+        return "env"
+
+    # Use the table gen_data resolves each cycle if it matches our settings
+    try:
+        with open(get_privileges_path(config, server), "rb") as pf:
+            table = marshal.load(pf)
+
+        if table["settings"] == get_privilege_settings(config):
+            return table["users"][user]
+    except (OSError, EOFError, ValueError, TypeError, KeyError):
+        pass
+
+    return get_privilege_level(config, user, get_user_groups(user))
+
 def print_job(job_id, job_info, settings, header = False, limit_user = None):
     if settings.f:
-        if limit_user:
-            if not job_info["Job_Owner"].startswith(f"{limit_user}@"):
-                job_info["Variable_List"] = "Hidden"
+        hidden = limit_user and not job_info["Job_Owner"].startswith(f"{limit_user}@")
 
-        if settings.F == "json":
-            global first_job
+        # Fragments hold the whole environment, so redacted jobs are formatted here
+        if hidden:
+            fragments = json_output.fragments if settings.F == "json" else full_blocks
 
-            if first_job:
-                print(',\n    "Jobs":{')
-                first_job = False
-            else:
-                print(",")
+            if fragments:
+                job_info = fragments.get_job_info(job_id, job_info)
 
-            print(textwrap.indent(json.dumps({job_id : job_info}, indent = 4, separators=(',', ':'))[2:-2], "    "), end = "")
+            job_info["Variable_List"] = "Hidden"
+
+        if settings.F == "json":
+            json_output.add(job_id, job_info, use_fragment = not hidden)
         elif settings.F == "dsv":
-            print("{}{}".format(f"Job Id: {job_id}{settings.D}", dsv_output(job_info, settings.D)))
+            output.writeline("{}{}".format(f"Job Id: {job_id}{settings.D}", dsv_output(job_info, settings.D)))
+        elif full_blocks and not hidden:
+            block = full_blocks.get(job_id)
+
+            if block and settings.w:
+                output.write(block)
+            elif block:
+                wrap_full_block(block)
+            else:
+                full_output(job_id, full_blocks.get_job_info(job_id, job_info), settings.w)
         else:
             full_output(job_id, job_info, settings.w)
     else:
@@ -424,14 +1007,88 @@ def print_nodes(nodes):
     while len(nodes) > 71:
         chunk = nodes[:71].rsplit("+", 1)[0] + "+"
         nodes = nodes[len(chunk):]
-        print("    {}".format(chunk))
+        output.writeline("    {}".format(chunk))
+
+    output.writeline("    {}".format(nodes))
+
+def compile_field(field_name, spec, process_start = None):
+    main_key, _, sub_key = field_name.partition("[")
+    sub_key = sub_key.rstrip("]")
+    key = sub_key or main_key
+    limit = None
+
+    # Mirror altair_string: values longer than the precision end in a suffix,
+    # while fill values, walltimes and the short owner name are simply cut
+    if "." in spec:
+        try:
+            limit = int(spec.rsplit(".")[-1])
+        except ValueError:
+            pass
+
+    suffix = "..." if key == "comment" else "*"
+    missing = "--" if key == "start_time" else " -- "
+    truncate = limit is not None and key != "walltime"
+    convert = process_start if key == "start_time" else None
+
+    if not sub_key and main_key == "Job_Id":
+        def get_value(job_id, job_info):
+            return job_id
+    elif not sub_key and main_key == "Job_Owner":
+        truncate = False
+
+        def get_value(job_id, job_info):
+            return job_info.get("Job_Owner", missing).split("@")[0]
+    elif sub_key:
+        def get_value(job_id, job_info):
+            try:
+                return job_info[main_key][sub_key]
+            except (KeyError, TypeError):
+                return None
+    else:
+        def get_value(job_id, job_info):
+            return job_info.get(main_key)
+
+    def render(job_id, job_info):
+        value = get_value(job_id, job_info)
+
+        if value is None:
+            return format(missing, spec)
+        elif not isinstance(value, str):
+            value = str(value)
+        elif convert:
+            value = format_start_time(value, convert, job_times.get(job_id, "estimated.start_time") if job_times else None)
 
-    print("    {}".format(nodes))
+        if truncate and len(value) > limit:
+            value = value[:(limit - len(suffix))] + suffix
+
+        return format(value, spec)
+
+    return render
+
+@functools.lru_cache(maxsize = None)
+def compile_format(fields, process_start = None, cap_widths = True):
+    if cap_widths:
+        fields = re.sub(r":([<>]*)([0-9]+)", r":\1\2.\2", fields)
+
+    layout, renderers = "", []
+
+    for literal, field_name, spec, _ in string.Formatter().parse(fields):
+        layout += literal.replace("{", "{{").replace("}", "}}")
+
+        if field_name is not None:
+            layout += "{}"
+            renderers.append(compile_field(field_name, spec, process_start))
+
+    def render_line(job_id, job_info):
+        return layout.format(*[render(job_id, job_info) for render in renderers])
+
+    return render_line
 
 def column_output(job_id, job_info, fields, mode, header, nodes, comment_format, unified, keep_dashes = False, process_start = None):
-    fields = re.sub(r":([<>]*)([0-9]+)", r":\1\2.\2", fields)
+    render_line = compile_format(fields, process_start)
 
     if header:
+        fields = re.sub(r":([<>]*)([0-9]+)", r":\1\2.\2", fields)
         label_fields = fields.replace(">", "")
 
         if mode == "default":
@@ -487,52 +1144,40 @@ def column_output(job_id, job_info, fields, mode, header, nodes, comment_format,
         dashes = 100 * "-"
 
         if mode == "default":
-            print(label_fields.format_map(labels))
+            output.writeline(label_fields.format_map(labels))
         else:
-            print("\n{}:".format(job_info["server"].split(".", maxsplit = 1)[0]))
+            output.writeline("\n{}:".format(job_info["server"].split(".", maxsplit = 1)[0]))
 
             if "estimated" in fields:
-                print(label_fields.format_map(l0_labels))
+                output.writeline(label_fields.format_map(l0_labels))
 
-            print(label_fields.format_map(l1_labels))
-            print(label_fields.format_map(l2_labels))
+            output.writeline(label_fields.format_map(l1_labels))
+            output.writeline(label_fields.format_map(l2_labels))
 
         if keep_dashes:
-            print(re.sub(r"{[^:}]*", r"{0", fields).format(dashes))
+            output.writeline(re.sub(r"{[^:}]*", r"{0", fields).format(dashes))
         else:
             dash_fields = re.sub(r"{[^:}]*", r"{0", fields.rsplit(maxsplit = 1)[0]) + " {0:5.5}"
-            print(dash_fields.format(dashes))
+            output.writeline(dash_fields.format(dashes))
 
-    if process_start:
-        job = altair_dict(job_info, fill_value = " -- ", process_start = process_start)
-    else:
-        job = altair_dict(job_info, fill_value = " -- ")
-
-    job["Job_Id"] = altair_string(job_id)
-    job["Job_Owner"] = job["Job_Owner"].split("@")[0]
-
-    try:
-        job_line = fields.format_map(job)
-    except TypeError:
-        print(job)
-        sys.exit()
+    job_line = render_line(job_id, job_info)
 
     if unified:
         if nodes:
-            job_line += " {exec_host}".format_map(job)
+            job_line += " " + compile_format("{exec_host}", cap_widths = False)(job_id, job_info)
         elif comment_format:
-            job_line += " " + comment_format.format_map(job)
+            job_line += " " + compile_format(comment_format, cap_widths = False)(job_id, job_info)
 
-    print(job_line)
+    output.writeline(job_line)
 
     if nodes and not unified:
-        print_nodes(job["exec_host"])
+        print_nodes(job_info.get("exec_host", " -- "))
 
     if comment_format and (not unified or nodes):
-        print(comment_format.format_map(job))
+        output.writeline(compile_format(comment_format, cap_widths = False)(job_id, job_info))
 
 def full_output(job_id, job_info, wide):
-    print("Job Id: {}".format(job_id))
+    output.writeline("Job Id: {}".format(job_id))
 
     for field in job_info.keys():
         if not isinstance(job_info[field], dict):
@@ -559,7 +1204,18 @@ def full_output(job_id, job_info, wide):
                 for subfield in job_info[field]:
                     print_wrapped("{}.{} = {}".format(field, subfield, job_info[field][subfield]), wide)
 
-    print()
+    output.writeline()
+
+def wrap_full_block(block):
+    # Blocks are stored wide, one indented line per field
+    lines = block.split("\n")
+    output.writeline(lines[0])
+
+    for line in lines[1:]:
+        if line:
+            print_wrapped(line[4:], False, 1 if line.startswith("    Variable_List = ") else 0)
+
+    output.writeline()
 
 def dsv_output(my_dict, delimiter, prefix = ""):
     line = ""
@@ -575,6 +1231,127 @@ def dsv_output(my_dict, delimiter, prefix = ""):
 
     return line[:-len(delimiter)]
 
+def json_fragment(job_id, job_info):
+    # Matches what json.dumps(indent = 4) gives for the job at its depth in the
+    # document, without going through the pure-Python indenting encoder
+    quote = json.encoder.encode_basestring_ascii
+    fields = []
+
+    for key, value in job_info.items():
+        if not isinstance(value, dict):
+            fields.append("            {}:{}".format(quote(key), quote(value)))
+        elif value:
+            items = ",\n".join("                {}:{}".format(quote(k), quote(v)) for k, v in value.items())
+            fields.append("            {}:{{\n{}\n            }}".format(quote(key), items))
+        else:
+            fields.append("            {}:{{}}".format(quote(key)))
+
+    if not fields:
+        return "        {}:{{}}".format(quote(job_id))
+
+    return "        {}:{{\n{}\n        }}".format(quote(job_id), ",\n".join(fields))
+
+class fragment_store:
+    # Jobs that gen_data rendered ahead of time, in one file and index per kind
+    def __init__(self, config, source, kind):
+        self.config, self.source, self.kind = config, source, kind
+        self.servers = {}
+        self.projected = False
+
+    def is_available(self, pbs_server):
+        if pbs_server not in self.servers:
+            self.servers[pbs_server] = None
+
+            try:
+                data_server = get_mapped_server(self.config, pbs_server)[0]
+                fragment_file = open(get_snapshot_path(self.config, data_server, self.source, self.kind), "rb")
+            except (IndexError, OSError):
+                return False
+
+            fragment_index = index.open_index(get_snapshot_path(self.config, data_server, self.source, f"{self.kind}.idx"),
+                    os.fstat(fragment_file.fileno()).st_size)
+
+            if fragment_index:
+                self.servers[pbs_server] = (data_server, fragment_index, blocks.block_reader(fragment_file))
+
+        return self.servers[pbs_server] is not None
+
+    def use(self, pbs_server):
+        # Callers then parse only the fields that filters look at
+        self.projected = self.is_available(pbs_server)
+        return self.projected
+
+    def get(self, job_id):
+        pbs_server = job_id.split(".", 1)[-1]
+
+        if self.is_available(pbs_server):
+            _, fragment_index, reader = self.servers[pbs_server]
+
+            for offset, length, key in index.search_index(fragment_index, [job_id]):
+                if key == job_id.encode():
+                    return reader.read(offset, length).decode(errors = "ignore")
+
+        return None
+
+    def get_job_info(self, job_id, job_info):
+        # Without a fragment, a projected job has to be read again in full
+        if self.projected:
+            data_server = get_mapped_server(self.config, job_id.split(".", 1)[-1])[0]
+
+            for found_id, found_info in get_job_data(self.config, data_server, self.source, True, [job_id]):
+                if found_id == job_id:
+                    return found_info
+
+        return job_info
+
+class time_table:
+    # Time fields that gen_data already parsed into epoch seconds
+    def __init__(self, config, source):
+        self.config, self.source = config, source
+        self.tables = {}
+
+    def get(self, job_id, field):
+        pbs_server = job_id.split(".", 1)[-1]
+
+        if (pbs_server, field) not in self.tables:
+            try:
+                data_server = get_mapped_server(self.config, pbs_server)[0]
+
+                with open(get_snapshot_path(self.config, data_server, self.source, f"times.{field}"), "rb") as tf:
+                    self.tables[pbs_server, field] = marshal.load(tf)
+            except (IndexError, OSError, EOFError, ValueError, TypeError):
+                self.tables[pbs_server, field] = {}
+
+        try:
+            return self.tables[pbs_server, field].get(job_id)
+        except AttributeError:
+            return None
+
+class json_writer:
+    def __init__(self, config, source, server_info):
+        self.fragments = fragment_store(config, source, "json")
+        self.first = True
+
+        output.write("\n".join(json.dumps(server_info, indent = 4, separators=(', ', ':')).splitlines()[0:4]))
+
+    def add(self, job_id, job_info, use_fragment = True):
+        if self.first:
+            output.writeline(',\n    "Jobs":{')
+            self.first = False
+        else:
+            output.writeline(",")
+
+        if use_fragment:
+            output.write(self.fragments.get(job_id) or json_fragment(job_id, self.fragments.get_job_info(job_id, job_info)))
+        else:
+            output.write(json_fragment(job_id, job_info))
+
+    def close(self):
+        if self.first:
+            output.writeline("\n}")
+        else:
+            output.writeline("\n    }\n}")
+
 def print_wrapped(line, wide = False, extra = 0):
     indent = "    "
     ilen = 4
@@ -591,11 +1368,41 @@ def print_wrapped(line, wide = False, extra = 0):
                 line = line[(79 - ilen - my_extra):]
                 my_extra = 0
 
-            print("{}{}".format(indent, chunk))
+            output.writeline("{}{}".format(indent, chunk))
             indent = "\t"
             ilen = 8
 
-    print("{}{}".format(indent, line))
+    output.writeline("{}{}".format(indent, line))
+
+def query_daemon(config):
+    import socket
+
+    request = { "argv"      : sys.argv[1:],
+                "env"       : {k : os.environ[k] for k in ("QSCACHE_DEBUG", "QSCACHE_IGNORE_AGE") if k in os.environ},
+                "encoding"  : sys.stdout.encoding }
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(int(config["cache"]["maxwait"]))
+            client.connect(config["daemon"]["socket"])
+            client.sendall(json.dumps(request).encode() + b"\n")
+
+            with client.makefile("rb") as reply:
+                status = json.loads(reply.readline().decode())
+
+                if "status" not in status:
+                    return None
+
+                job_output = reply.read()
+    except (OSError, ValueError):
+        return None
+
+    sys.stdout.flush()
+    sys.stdout.buffer.write(job_output)
+    sys.stdout.flush()
+    print(status["stderr"], end = "", file = sys.stderr)
+
+    return status["status"]
 
 def process_custom_format(format_str):
     old_specs = [spec.group(1) for spec in re.finditer("{([^}]*)}", format_str)]
@@ -616,13 +1423,7 @@ def process_custom_format(format_str):
 
     return format_str
 
-def main():
-    my_root = os.path.dirname(os.path.realpath(__file__))
-    my_username = getpass.getuser()
-
-    # Prevent pipe interrupt errors
-    signal(SIGPIPE,SIG_DFL)
-
+def get_parser():
     arg_dict = { "filters"      : "job IDs or queues",
                  "-1"           : "display node or comment information on job line",
                  "-a"           : "display all jobs (default unless -f specified)",
@@ -658,7 +1459,89 @@ def main():
         else:
             parser.add_argument(arg, help = arg_dict[arg], action = "store_true")
 
-    args, unknown = parser.parse_known_args()
+    return parser
+
+def get_column_format(args):
+    if args.a or args.u or args.s or args.n or args.H or args.T:
+        if args.w:
+            fields =  "{Job_Id:30} {Job_Owner:15} {queue:15} {Job_Name:15} {session_id:>8} "
+            fields += "{Resource_List[nodect]:>4} {Resource_List[ncpus]:>5} {Resource_List[mem]:>6} "
+            if args.T:
+                fields += "{Resource_List[walltime]:>5} {job_state:1} {estimated[start_time]}"
+            else:
+                fields += "{Resource_List[walltime]:>5} {job_state:1} {resources_used[walltime]}"
+        else:
+            fields =  "{Job_Id:15} {Job_Owner:8} {queue:8} {Job_Name:10} {session_id:>6} "
+            fields += "{Resource_List[nodect]:>3} {Resource_List[ncpus]:>3} {Resource_List[mem]:>6} "
+            if args.T:
+                fields += "{Resource_List[walltime]:>5} {job_state:1} {estimated[start_time]:>5}"
+            else:
+                fields += "{Resource_List[walltime]:>5} {job_state:1} {resources_used[walltime]:>5}"
+    elif args.w:
+        fields =  "{Job_Id:30} {Job_Name:15} {Job_Owner:15} {resources_used[cput]:>8} "
+        fields += "{job_state:1} {queue:15}"
+    else:
+        fields =  "{Job_Id:17} {Job_Name:16} {Job_Owner:16} {resources_used[cput]:>8} "
+        fields += "{job_state:1} {queue:16}"
+
+    return fields
+
+def get_view_name(args):
+    # Only plain listings (optionally -a, -w and -u) are rendered ahead of time
+    for option in ("filters", "f", "format", "x", "H", "s", "n", "T", "t", "J", "status", "noheader", "1"):
+        if getattr(args, option):
+            return None
+
+    return "{}{}".format("alt" if args.a or args.u else "default", "-wide" if args.w else "")
+
+def print_view(config, server, view, user = None):
+    view_path = get_snapshot_path(config, server, "active", f"view-{view}")
+
+    try:
+        if user:
+            view_path += "-users"
+
+            with open(view_path, "rb") as view_file:
+                locations = index.find_records(f"{view_path}.idx", [index.secondary_key("owner", user)], os.fstat(view_file.fileno()).st_size)
+
+                if locations is None:
+                    return False
+
+                for offset, length, _ in locations:
+                    view_file.seek(offset)
+                    output.write(view_file.read(length).decode(errors = "ignore"))
+        else:
+            with open(view_path, "rb") as view_file:
+                output.write(view_file.read().decode(errors = "ignore"))
+    except OSError:
+        return False
+
+    return True
+
+def enable_profile(config, wall, cpu, config_wall, config_cpu):
+    global profile
+    profile = None
+
+    for name in PROFILE_PHASES:
+        globals()[name] = getattr(globals()[name], "__wrapped__", globals()[name])
+
+    if "QSCACHE_PROFILE" in os.environ or config["cache"]["profile"] == "True":
+        profile = phase_timer(wall, cpu)
+        profile.add("config", config_wall, config_cpu)
+
+        for name, (phase, count) in PROFILE_PHASES.items():
+            globals()[name] = profile.wrap(phase, globals()[name], count)
+
+def main(user = None, use_daemon = True):
+    start_wall, start_cpu = timer(), time.process_time()
+    my_root = os.path.dirname(os.path.realpath(__file__))
+    my_username = user or getpass.getuser()
+
+    # Prevent pipe interrupt errors
+    signal(SIGPIPE,SIG_DFL)
+    refresh_requests.clear()
+
+    args, unknown = get_parser().parse_known_args()
 
     # The user may intersperse positional and optional args, so we need to handle that
     unsupported = []
@@ -681,10 +1564,17 @@ def main():
     except KeyError:
         server = "site"
 
+    config_wall, config_cpu = timer(), time.process_time()
     config = read_config("{}/cfg/{}.cfg".format(my_root, server), my_root, server)
+    enable_profile(config, start_wall, start_cpu, timer() - config_wall, time.process_time() - config_cpu)
 
     if config["paths"]["logs"]:
-        config["run"]["log"] = "{}/{}-{}.log".format(config["paths"]["logs"], my_username, DT_NOW.strftime("%Y%m%d"))
+        config["run"]["user"] = my_username
+
+        if config["paths"]["logformat"] == "jsonl":
+            config["run"]["log"] = "{}/qstat-{}-{}.jsonl".format(config["paths"]["logs"], config["run"]["host"], DT_NOW.strftime("%Y%m%d"))
+        else:
+            config["run"]["log"] = "{}/{}-{}.log".format(config["paths"]["logs"], my_username, DT_NOW.strftime("%Y%m%d"))
 
     if "QSCACHE_BYPASS" in os.environ:
         bypass_cache(config, "manual")
@@ -692,11 +1582,19 @@ def main():
     if unsupported:
         bypass_cache(config, "args")
 
-    my_host = socket.gethostname()
-    my_privilege = check_privilege(config, my_username)
+    # A resident daemon on this host can answer from memory; otherwise read files
+    if use_daemon and config["daemon"]["socket"]:
+        status = query_daemon(config)
+
+        if status is not None:
+            return status
+
+    my_host = config["run"]["host"]
+    my_privilege = check_privilege(config, server, my_username)
     my_status = 0
     limit_user = None
     process_env = False
+    projection = None
     source = "active"
 
     if args.x or args.H:
@@ -711,10 +1609,16 @@ def main():
         if my_privilege != "env":
             limit_user = my_username
 
+    view = get_view_name(args)
     header = not args.noheader
     host_data_server, host_pbs_server = get_mapped_server(config, server)
     data_server, pbs_server = host_data_server, host_pbs_server
     server_info = get_server_info(config, data_server, source)
+    record_read(config, data_server, source)
+
+    global json_output, full_blocks, job_times
+    json_output, full_blocks, fragments = None, None, None
+    job_times = time_table(config, source) if args.T else None
 
     # Only process environment if full-output (expensive)
     if args.f:
@@ -722,32 +1626,20 @@ def main():
 
         # If JSON output, need to read in header fields
         if args.F == "json":
-            print("\n".join(json.dumps(server_info, indent = 4, separators=(', ', ':')).splitlines()[0:4]), end = "")
-            global first_job
-            first_job = True
+            json_output = json_writer(config, source, server_info)
+            fragments = json_output.fragments
+        elif not args.F:
+            full_blocks = fragments = fragment_store(config, source, "full")
+
+        # Jobs rendered ahead of time only need the fields that filters look at
+        if fragments and fragments.use(host_pbs_server):
+            process_env, projection = False, get_projection("")
     else:
         if not args.format:
-            if args.a or args.u or args.s or args.n or args.H or args.T:
-                if args.w:
-                    args.format =  "{Job_Id:30} {Job_Owner:15} {queue:15} {Job_Name:15} {session_id:>8} "
-                    args.format += "{Resource_List[nodect]:>4} {Resource_List[ncpus]:>5} {Resource_List[mem]:>6} "
-                    if args.T:
-                        args.format += "{Resource_List[walltime]:>5} {job_state:1} {estimated[start_time]}"
-                    else:
-                        args.format += "{Resource_List[walltime]:>5} {job_state:1} {resources_used[walltime]}"
-                else:
-                    args.format =  "{Job_Id:15} {Job_Owner:8} {queue:8} {Job_Name:10} {session_id:>6} "
-                    args.format += "{Resource_List[nodect]:>3} {Resource_List[ncpus]:>3} {Resource_List[mem]:>6} "
-                    if args.T:
-                        args.format += "{Resource_List[walltime]:>5} {job_state:1} {estimated[start_time]:>5}"
-                    else:
-                        args.format += "{Resource_List[walltime]:>5} {job_state:1} {resources_used[walltime]:>5}"
-            elif args.w:
-                args.format =  "{Job_Id:30} {Job_Name:15} {Job_Owner:15} {resources_used[cput]:>8} "
-                args.format += "{job_state:1} {queue:15}"
-            else:
-                args.format =  "{Job_Id:17} {Job_Name:16} {Job_Owner:16} {resources_used[cput]:>8} "
-                args.format += "{job_state:1} {queue:16}"
+            args.format = get_column_format(args)
+
+        # Column output only needs the fields named in the format
+        projection = get_projection(args.format)
 
     if args.filters:
         ids, subjobs = [], []
@@ -768,7 +1660,7 @@ def main():
                 ft_pbs_server = host_pbs_server
 
             if ft_data_server != data_server:
-                my_status = process_jobs(config, data_server, source, header, limit_user, args, ids, subjobs, process_env, my_status)
+                my_status = process_jobs(config, data_server, source, header, limit_user, args, ids, subjobs, process_env, my_status, projection)
                 header, ids = not args.noheader, []
                 data_server = ft_data_server
 
@@ -782,27 +1674,29 @@ def main():
                         subjobs.append(ids[-1])
             else:
                 if ids:
-                    my_status = process_jobs(config, data_server, source, header, limit_user, args, ids, subjobs, process_env, my_status)
+                    my_status = process_jobs(config, data_server, source, header, limit_user, args, ids, subjobs, process_env, my_status, projection)
                     header, ids = False, []
 
-                for job_id, job_info in get_job_data(config, data_server, source, process_env):
+                select_keys = get_select_keys(args, ft_name)
+
+                for job_id, job_info in get_job_data(config, data_server, source, process_env, select_keys = select_keys, projection = projection, subjobs = args.t):
                     if check_job(job_id, job_info, select_queue = f"{ft_name}@{ft_pbs_server}", filters = args):
                         print_job(job_id, job_info, args, header, limit_user)
                         header = False
 
-        my_status = process_jobs(config, data_server, source, header, limit_user, args, ids, subjobs, process_env, my_status)
-    else:
-        for job_id, job_info in get_job_data(config, data_server, source, process_env):
+        my_status = process_jobs(config, data_server, source, header, limit_user, args, ids, subjobs, process_env, my_status, projection)
+    elif not view or not print_view(config, data_server, view, args.u):
+        select_keys = get_select_keys(args)
+
+        for job_id, job_info in get_job_data(config, data_server, source, process_env, select_keys = select_keys, projection = projection, subjobs = args.t):
             if check_job(job_id, job_info, select_queue = f"@{pbs_server}", filters = args):
                 print_job(job_id, job_info, args, header, limit_user)
                 header = False
 
     if args.f and args.F == "json":
-        if first_job:
-            print("\n}")
-        else:
-            print("\n    }\n}")
+        json_output.close()
 
+    output.flush()
     log_usage(config, "yes")
 
     if "QSCACHE_DEBUG" in os.environ:
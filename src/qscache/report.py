@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+import os, sys, re, json, glob, argparse, collections
+from datetime import datetime
+
+# Positional job IDs and -u names vary per call, so fold them into placeholders
+# to see which kinds of query dominate
+ID_RE = re.compile(r"^[0-9]+(\[[0-9]*\])?([.@]\S+)?$")
+
+def get_pattern(args):
+    pattern, skip_user = [], False
+
+    for arg in args:
+        if skip_user:
+            pattern.append("<user>")
+            skip_user = False
+        elif ID_RE.match(arg):
+            if pattern and pattern[-1] in ("<id>", "<id>..."):
+                pattern[-1] = "<id>..."
+            else:
+                pattern.append("<id>")
+        else:
+            pattern.append(arg)
+            skip_user = arg == "-u"
+
+    return " ".join(pattern) or "(none)"
+
+def is_record(record):
+    # Every user can append to the logs, so anything else in them is skipped
+    try:
+        return (isinstance(record["time"], (int, float)) and isinstance(record["cache"], str) and
+                isinstance(record["user"], str) and isinstance(record["args"], list) and
+                all(isinstance(arg, str) for arg in record["args"]) and isinstance(record.get("reason", ""), str))
+    except (KeyError, TypeError):
+        return False
+
+def read_records(paths):
+    for path in paths:
+        with open(path, "r", errors = "replace") as lf:
+            for line in lf:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+
+                if is_record(record):
+                    yield record
+
+def summarize(records):
+    stats = { "calls" : 0, "hits" : 0, "reasons" : collections.Counter(), "patterns" : collections.Counter(),
+              "pattern_ms" : collections.Counter(), "user_calls" : collections.Counter(),
+              "user_minutes" : collections.Counter(), "first" : None, "last" : None }
+
+    for record in records:
+        stats["calls"] += 1
+        stats["first"] = min(stats["first"] or record["time"], record["time"])
+        stats["last"] = max(stats["last"] or record["time"], record["time"])
+
+        if record["cache"] == "yes":
+            stats["hits"] += 1
+        else:
+            stats["reasons"][record.get("reason", "unknown")] += 1
+
+        pattern = get_pattern(record["args"])
+        stats["patterns"][pattern] += 1
+
+        try:
+            stats["pattern_ms"][pattern] += record.get("profile", {})["total"][0]
+        except (KeyError, IndexError, TypeError):
+            pass
+
+        stats["user_calls"][record["user"]] += 1
+        stats["user_minutes"][record["user"], int(record["time"] // 60)] += 1
+
+    return stats
+
+def print_report(stats, top):
+    if not stats["calls"]:
+        print("No qstat calls found")
+        return
+
+    first, last = (datetime.fromtimestamp(stats[k]).strftime("%Y-%m-%d %H:%M:%S") for k in ("first", "last"))
+    print(f"Calls from {first} to {last}: {stats['calls']}")
+    print("Cache hit rate: {:.1f}%".format(100 * stats["hits"] / stats["calls"]))
+
+    if stats["reasons"]:
+        print("\nBypass reasons:")
+
+        for reason, count in stats["reasons"].most_common():
+            print("    {:12} {:>8} {:>6.1f}%".format(reason, count, 100 * count / stats["calls"]))
+
+    peaks, minutes = collections.Counter(), collections.Counter()
+
+    for (user, _), count in stats["user_minutes"].items():
+        peaks[user] = max(peaks[user], count)
+        minutes[user] += 1
+
+    print(f"\nBusiest users (top {top} by peak calls per minute):")
+    print("    {:16} {:>8} {:>10} {:>10}".format("user", "calls", "peak/min", "mean/min"))
+
+    for user, peak in peaks.most_common(top):
+        print("    {:16} {:>8} {:>10} {:>10.1f}".format(user, stats["user_calls"][user], peak,
+                stats["user_calls"][user] / minutes[user]))
+
+    print(f"\nHeaviest argument patterns (top {top} by calls):")
+    print("    {:>8} {:>12}  {}".format("calls", "total ms", "arguments"))
+
+    for pattern, count in stats["patterns"].most_common(top):
+        total_ms = "{:.0f}".format(stats["pattern_ms"][pattern]) if pattern in stats["pattern_ms"] else "-"
+        print("    {:>8} {:>12}  {}".format(count, total_ms, pattern))
+
+def main():
+    my_root = os.path.dirname(os.path.realpath(__file__))
+    from qscache.qscache import read_config
+
+    parser = argparse.ArgumentParser(prog = "usage_report", description = "Summarize qstat usage logs (JSONL format).")
+    parser.add_argument("logs", nargs = "*", help = "log files to read (default: all hosts in the configured log path)")
+    parser.add_argument("--date", default = datetime.now().strftime("%Y%m%d"), help = "day to report when using the log path (YYYYMMDD)")
+    parser.add_argument("--top", type = int, default = 10, help = "number of users and patterns to list (default: 10)")
+    args = parser.parse_args()
+
+    if not args.logs:
+        try:
+            server = os.environ["QSCACHE_SERVER"]
+        except KeyError:
+            server = "site"
+
+        config = read_config("{}/cfg/{}.cfg".format(my_root, server), my_root, server)
+
+        if not config["paths"]["logs"]:
+            print("Error: 'Logs' path not set in site config; specify log files instead", file = sys.stderr)
+            sys.exit(1)
+
+        args.logs = sorted(glob.glob("{}/qstat-*-{}.jsonl".format(config["paths"]["logs"], args.date)))
+
+    print_report(summarize(read_records(args.logs)), args.top)
+
+if __name__ == "__main__":
+    main()